@@ -11,18 +11,28 @@ documents_filepath="resources/documents.jsonl"
 #    exit 1
 #fi
 
-# build indexes
-rm -rf indexes
-mkdir -p indexes
-python -m pyserini.index.lucene \
-  --collection JsonCollection \
-  --input resources \
-  --index indexes \
-  --generator DefaultLuceneDocumentGenerator \
-  --threads 1 \
-  --storePositions --storeDocvectors --storeRaw
+# build indexes, reading resources/documents.jsonl.gz directly when documents.jsonl is
+# absent, and adding the shop_id / price / service fields used for filter pushdown.
+# "./build_index.sh" rebuilds from scratch, "./build_index.sh incremental"
+# only re-indexes documents whose content changed since the last build
+mode=${1:-full}
+shards=${SHARDS:-$(nproc)}
+incremental_flag=""
+if [ "$mode" = "incremental" ]; then
+    incremental_flag="--incremental"
+fi
+python src/search_engine/build_index.py $documents_filepath indexes --shards $shards $incremental_flag
 if [ $? -eq 0 ]; then
     echo "build indexes success"
 else
     exit 1
 fi
+
+# build product store (columnar sidecar keyed by lucene docid)
+rm -rf product_store
+python src/search_engine/product_store.py indexes product_store
+if [ $? -eq 0 ]; then
+    echo "build product store success"
+else
+    exit 1
+fi
@@ -38,12 +38,14 @@ fi
 echo "Creating resources directory..."
 mkdir -p resources
 
-# Check if documents.jsonl exists in resources
-if [ ! -f "resources/documents.jsonl" ]; then
-    echo "Warning: documents.jsonl not found in resources directory"
-    echo "Please place the documents.jsonl file in the resources directory"
-else
+# Check if documents.jsonl or documents.jsonl.gz exists in resources
+if [ -f "resources/documents.jsonl" ]; then
     echo "Found documents.jsonl in resources directory"
+elif [ -f "resources/documents.jsonl.gz" ]; then
+    echo "Found documents.jsonl.gz in resources directory"
+else
+    echo "Warning: documents.jsonl not found in resources directory"
+    echo "Please place the documents.jsonl(.gz) file in the resources directory"
 fi
 
 # Build search index if build_index.sh exists and index is not already built
@@ -63,19 +65,19 @@ echo "Starting search engine service..."
 python src/search_engine/server.py > server.log 2>&1 &
 SERVER_PID=$!
 
-# Monitor the server output until "Load index done" is detected
+# Poll the readiness endpoint, the server answers it while the indexes load
 echo "Waiting for server to load index..."
 INDEX_LOADED=false
 while kill -0 $SERVER_PID 2>/dev/null; do
-    # Check if "Load index done" appears in the output
-    if grep -q "Load indexes done." server.log; then
+    # /healthz returns 200 once the indexes are loaded and warmed up
+    if curl -sf http://127.0.0.1:5631/healthz > /dev/null 2>&1 || grep -q "Load indexes done." server.log; then
         echo "Index loaded successfully!"
         echo "Server is running in background with PID: $SERVER_PID"
         echo "Search engine service started successfully!"
         INDEX_LOADED=true
         break
     fi
-    sleep 1
+    sleep 0.2
 done
 
 # Check if index was loaded successfully
@@ -4,13 +4,13 @@ from collections import defaultdict
 
 import tiktoken
 from tqdm import tqdm
-from pyserini.search.lucene import LuceneSearcher
 
 from run_evaluate import (
     load_rollout_outputs,
     load_synthesize_rewards,
     load_synthesize_vouchers,
     load_synthesize_web_rewards,
+    searcher,
     extract_recommed_product,
     eval_product,
     eval_shop,
@@ -24,7 +24,6 @@ import random
 
 random.seed(42)
 
-searcher = LuceneSearcher("indexes")
 enc = tiktoken.encoding_for_model("gpt-4o")
 
 def eval_web(score, output, reward, kw):
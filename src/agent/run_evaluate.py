@@ -1,30 +1,38 @@
+import os
 import sys
 import ujson as json
 from collections import defaultdict
 
 from tqdm import tqdm
-from pyserini.search.lucene import LuceneSearcher
 
 from rewards.orm import ground_truth_reward, rule_score_reward, length_reward, web_rule_score_reward, web_response_score_reward
 from rewards.prm import format_reward
 from util.message import Message, OUTPUT_ROLES
+from util.rollout_index import RolloutIndex
+from util.trace import expand_trace
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "search_engine"))
+from search_client import get_searcher
 
 FIELDS = ["title", "price", "service", "sku & attrs"]
+# rollout lines evaluated per file
+MAX_QUERIES = 501
 
-searcher = LuceneSearcher("indexes")
+searcher = get_searcher("indexes")
 
 
 def load_rollout_outputs(config: dict) -> dict:
+    # the first "max_queries" rollout lines (the last one of a repeated query
+    # wins), read by seeking to them through the index of the rollout file
+    rollout_index = RolloutIndex(config["rollout_file"])
+    entries = rollout_index.load()[:config.get("max_queries", MAX_QUERIES)]
+    latest = {entry["query_hash"]: entry for entry in entries}
+    entries = [entry for entry in entries if latest[entry["query_hash"]] is entry]
+
     rollout_outputs = dict()
-    cnt = 0
-    with open(config["rollout_file"], "r") as fin:
-        for line in tqdm(fin, desc="Load roll out outputs: "):
-            if cnt>500:
-                break
-            jsonobj = json.loads(line.strip())
-            query = jsonobj[0]["extra_info"]["query"]
-            rollout_outputs[query] = jsonobj
-            cnt +=1
+    for jsonobj in tqdm(rollout_index.read(entries), total=len(entries), desc="Load roll out outputs: "):
+        query = jsonobj[0]["extra_info"]["query"]
+        rollout_outputs[query] = expand_trace(jsonobj)
     return rollout_outputs
 
 
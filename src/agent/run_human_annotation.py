@@ -3,7 +3,6 @@ import sys
 import time
 import copy
 import portalocker
-import asyncio
 import ujson as json
 from tqdm import tqdm
 from colorama import init, Fore
@@ -73,7 +72,7 @@ def act(message: Message):
             continue
 
         tool = toolmap[name]
-        results = asyncio.run(tool.execute(**parameters)) if tool.name == "web_search" else tool.execute(**parameters)
+        results = tool.execute(**parameters)
         if name == "find_product" and results:
             product_ids = []
             for product in results:
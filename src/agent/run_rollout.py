@@ -2,19 +2,33 @@ import os
 import sys
 import time
 import copy
-import portalocker
-import multiprocessing as mp
+import hashlib
+import logging
 import asyncio
 import ujson as json
 from tqdm import tqdm
 
 from toolkit import tools, toolmap
-from util.llm import ask_llm
+from util.llm import aask_llm
 from util.message import Message, USER_ROLES, ASSISTANT_ROLES
+from util.rate_limiter import RateLimiter
+from util.rollout_index import RolloutIndex, get_query_hash
+from util.tool_cache import ToolCache
+from util.trace import PromptBuilder, TurnBuilder, compact_step
 
 
 MAX_STEPS = 30
 
+logger = logging.getLogger(__name__)
+
+# endpoint -> RateLimiter, from the "rate_limits" of the config, e.g.
+# {"llm": 10, "find_product": 100, "web_search": 5} in requests per second
+rate_limiters = dict()
+# identical find_product / view_product_information calls recur across the
+# rollouts of a query and across models; set "tool_cache_file" in the config
+# (or TOOL_CACHE_FILE) to share the results between processes and runs
+tool_cache = ToolCache(os.environ.get("TOOL_CACHE_FILE"))
+
 
 def get_system_prompt(config: dict) -> str:
     with open(config["system_prompt_file"], "r") as fin:
@@ -43,39 +57,64 @@ def get_user_prompt(message: Message, history_messages: list[str]) -> str:
     return f"# Dialogue Records History\n{history}"
 
 
-def think(
-    system_prompt: str,
-    user_prompt: str,
+def get_route(query: str, config: dict) -> tuple[str, dict]:
+    # sticky routing: every step of a query goes to the same server, whose
+    # prefix cache holds the dialogue so far. "base_urls" spreads the queries
+    # over several servers, the session header is for a routing proxy in front
+    session_id = hashlib.md5(query.encode("utf-8")).hexdigest()
+    base_url = config.get("base_url", "")
+    if config.get("base_urls"):
+        base_url = config["base_urls"][int(session_id, 16) % len(config["base_urls"])]
+    return base_url, {config.get("session_header", "X-Session-ID"): session_id}
+
+
+async def think(
+    messages: list[dict],
     model_config: dict,
     base_url: str | None = None,
     api_key: str | None = None,
-) -> tuple[str, str, Message]:
-    reasoning_content, content = ask_llm(
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
+    extra_headers: dict | None = None,
+) -> tuple[str, str, Message, dict]:
+    if "llm" in rate_limiters:
+        await rate_limiters["llm"].acquire()
+    reasoning_content, content, usage = await aask_llm(
+        messages=messages,
         model_config=model_config,
         base_url=base_url,
-        api_key=api_key
+        api_key=api_key,
+        extra_headers=extra_headers,
     )
 
-    return reasoning_content, content, Message.from_string(reasoning_content, content)
-
-
-def act(message: Message) -> list[dict]:
-    obs = []
-    for commend in message.tool_call:
-        if commend["name"] not in toolmap:
-            continue
-        tool = toolmap[commend["name"]]
-        obs.append(
-            {
-                "tool_call_id": commend["tool_call_id"],
-                "results": asyncio.run(tool.execute(**commend["parameters"])) if tool.name == "web_search" else tool.execute(**commend["parameters"]),
-            }
-        )
-    return obs
+    return reasoning_content, content, Message.from_string(reasoning_content, content), usage
+
+
+async def call_tool(commend: dict) -> tuple:
+    # -> (results, whether they came from the tool cache)
+    key = await tool_cache.aget_key(commend["name"], commend["parameters"])
+    if key is not None:
+        results = await tool_cache.aget(key)
+        if results is not None:
+            return results, True
+    if commend["name"] in rate_limiters:
+        await rate_limiters[commend["name"]].acquire()
+    results = await toolmap[commend["name"]].aexecute(**commend["parameters"])
+    if key is not None and results is not None:
+        await tool_cache.aput(key, results)
+    return results, False
+
+
+async def aact(message: Message) -> tuple[list[dict], int]:
+    # every tool call of the message runs concurrently, observations keep their order
+    commends = [commend for commend in message.tool_call if commend["name"] in toolmap]
+    results = await asyncio.gather(*(call_tool(commend) for commend in commends))
+    obs = [
+        {
+            "tool_call_id": commend["tool_call_id"],
+            "results": result,
+        }
+        for commend, (result, _) in zip(commends, results)
+    ]
+    return obs, sum(is_hit for _, is_hit in results)
 
 
 def is_terminate(message: Message) -> bool:
@@ -84,108 +123,115 @@ def is_terminate(message: Message) -> bool:
     return False
 
 
-def react_loop(query: str, config: dict):
+async def react_loop(query: str, config: dict):
     corpus_tracker = []
-    history_messages = []
+    # "full" (default) or "compact", and "single" (default) or "multi_turn", see util/trace.py
+    trace_format = config.get("trace_format", "full")
+    prompt_layout = config.get("prompt_layout", "single")
+    base_url, extra_headers = get_route(query, config)
     message = Message(user=query)
+    content = ""
     system_prompt = get_system_prompt(config)
+    prompt_builder = PromptBuilder()
+    turn_builder = TurnBuilder(system_prompt)
     #print(f"System Prompt:\n{system_prompt}")
     for step in range(1, MAX_STEPS + 1):
-        user_prompt = get_user_prompt(message, history_messages)
+        if prompt_layout == "multi_turn":
+            delta = turn_builder.update(message, content)
+            messages = list(turn_builder.messages)
+        else:
+            delta = prompt_builder.update(message)
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt_builder.user_prompt},
+            ]
         message.clear()
-        reasoning_content, content, message = think(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
+        reasoning_content, content, message, usage = await think(
+            messages=messages,
             model_config=config["model_config"],
-            base_url=config.get("base_url", ""),
+            base_url=base_url,
             api_key=config.get("api_key", ""),
+            extra_headers=extra_headers,
         )
+        tool_cache_hits = 0
         if message.tool_call:
-            message.obs = act(message)
-
-        corpus_tracker.append(
-            {
-                "prompt": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                "completion": {
-                    "reasoning_content": reasoning_content,
-                    "content": content,
-                    "message": copy.deepcopy(message.to_dict()),
-                },
-                "extra_info": {
-                    "step": step,
-                    "query": query,
-                    "timestamp": int(time.time() * 1000),
-                },
-            }
-        )
+            message.obs, tool_cache_hits = await aact(message)
+
+        tracked_step = {
+            "completion": {
+                "reasoning_content": reasoning_content,
+                "content": content,
+                "message": copy.deepcopy(message.to_dict()),
+            },
+            "extra_info": {
+                "step": step,
+                "query": query,
+                "timestamp": int(time.time() * 1000),
+                "tool_cache_hits": tool_cache_hits,
+                # prompt_tokens, and cached_tokens / prefix_hit_rate if the backend reports them
+                "usage": usage,
+            },
+        }
+        if trace_format == "compact":
+            tracked_step = compact_step(tracked_step, system_prompt, delta, prompt_layout)
+        else:
+            tracked_step = {"prompt": messages, **tracked_step}
+        corpus_tracker.append(tracked_step)
         #print(f"{'*' * 20}Setps: {step}/{MAX_STEPS}{'*' * 20}\nReasoning Content: {reasoning_content}\nContent: {content}\nMessage: {json.dumps(message.to_dict(), indent=4)}\n")
         if is_terminate(message):
             break
 
-    with open(config["rollout_file"], "a") as fout:
-        portalocker.lock(fout, portalocker.LOCK_EX)
-        fout.write(f"{json.dumps(corpus_tracker)}\n")
-        fout.flush()
-        portalocker.unlock(fout)
-
-
-def producer(queue: mp.Queue, config: dict):
-    had_queries = set()
-    if os.path.exists(config["rollout_file"]):
-        with open(config["rollout_file"], "r") as fin:
-            portalocker.lock(fin, portalocker.LOCK_EX)
-            for line in fin:
-                jsonobj = json.loads(line.strip())
-                query = jsonobj[0]["extra_info"]["query"]
-                had_queries.add(query)
-            portalocker.unlock(fin)
-
-    total = int(os.popen(f"wc -l {config['synthesize_file']}").read().strip().split(" ", 1)[0])
-    pbar = tqdm(total=total - len(had_queries), desc="Start rolling out the remaining queries: ")
+    # the file lock may be held by another rollout run, keep it off the event loop
+    await asyncio.to_thread(write_rollout, config, corpus_tracker)
+
+
+def write_rollout(config: dict, corpus_tracker: list[dict]):
+    RolloutIndex(config["rollout_file"]).append(corpus_tracker)
+
+
+def load_remaining_queries(config: dict) -> list[str]:
+    # resume: skip the queries already in the rollout file (from its index), and duplicates
+    had_queries = {entry["query_hash"] for entry in RolloutIndex(config["rollout_file"]).load()}
+
+    queries = []
     with open(config["synthesize_file"], "r") as fin:
         for line in fin:
             jsonobj = json.loads(line.strip())
             query = jsonobj["query"]
-            if query in had_queries:
+            query_hash = get_query_hash(query)
+            if query_hash in had_queries:
                 continue
-            queue.put(query)
-            had_queries.add(query)
+            queries.append(query)
+            had_queries.add(query_hash)
+    return queries
+
+
+async def arollout(config: dict):
+    # react loops of up to `concurrency` queries run as coroutines of one
+    # event loop, they spend nearly all their time waiting on the llm and tools
+    queries = load_remaining_queries(config)
+    concurrency = config.get("concurrency", config["threads"])
+    for endpoint, rate in config.get("rate_limits", {}).items():
+        rate_limiters[endpoint] = RateLimiter(rate)
+
+    pbar = tqdm(total=len(queries), desc="Start rolling out the remaining queries: ")
+    pending = iter(queries)
+
+    async def worker():
+        for query in pending:
+            try:
+                await react_loop(query, config)
+            except Exception as e:
+                # not written, so the query is rolled out again on resume
+                logger.exception(f"Roll out query failed: {query}: {e}")
             pbar.update(1)
-            #print(f"Put query: {query}")
-    queue.put(None)
 
-
-def consumer(queue: mp.Queue, config: dict):
-    while True:
-        query = queue.get()
-        if query is None:
-            queue.put(None)
-            break
-        #print(f"Get query: {query}")
-        react_loop(query, config)
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(queries))))))
+    pbar.close()
 
 
 def rollout(config: dict):
-    queue = mp.Queue(config["threads"])
-
-    # Create processes
-    producer_process = mp.Process(target=producer, args=(queue, config))
-    consumers = []
-    for _ in range(config["threads"]):
-        consumers.append(mp.Process(target=consumer, args=(queue, config)))
-
-    # Start processes
-    producer_process.start()
-    for consumer_process in consumers:
-        consumer_process.start()
-
-    # Join processes
-    producer_process.join()
-    for consumer_process in consumers:
-        consumer_process.join() 
+    asyncio.run(arollout(config))
 
 
 if __name__ == "__main__":
@@ -194,4 +240,6 @@ if __name__ == "__main__":
         config = json.load(fin)
     if config["task"] != "knowledge":
         config["exclude_tools"] = config.get("exclude_tools", []) + ["web_search"]
+    if config.get("tool_cache_file"):
+        tool_cache.sqlite_file = config["tool_cache_file"]
     rollout(config)
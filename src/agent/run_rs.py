@@ -16,6 +16,7 @@ from run_evaluate import (
 from rewards.orm import length_reward
 from rewards.prm import format_reward
 from util.message import Message, OUTPUT_ROLES
+from util.trace import get_user_prompt
 
 
 enc = tiktoken.encoding_for_model("gpt-4o")
@@ -122,7 +123,7 @@ def reject_sample(config: dict):
             format_ns.add(query)
 
             system_prompt = [x["content"] for x in step["prompt"] if x["role"] == "system"][0]
-            user_prompt = [x["content"] for x in step["prompt"] if x["role"] == "user"][0]
+            user_prompt = get_user_prompt(step["prompt"])
             data = {
                 "instruction": system_prompt,
                 "input": user_prompt,
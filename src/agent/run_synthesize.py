@@ -3,45 +3,37 @@ import re
 import sys
 import math
 import random
+import itertools
 import ujson as json
 from collections import defaultdict
 
 from tqdm import tqdm
-from pyserini.search.lucene import LuceneSearcher
 
 from util.llm import ask_llm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "search_engine"))
+from document_reader import iter_products
+from search_client import get_searcher
+
 
 random.seed(42)
-searcher = LuceneSearcher("indexes")
+searcher = get_searcher("indexes")
 
 
 def load_sid2pids(config: dict) -> dict:
     shop2products = defaultdict(list)
-    total = int(
-        os.popen(f"wc -l {config['documents_file']}").read().strip().split(" ", 1)[0]
-    )
-    with open(config["documents_file"], "r") as fin:
-        for line in tqdm(fin, total=total, desc="Load `shop -> products` mappings: "):
-            jsonobj = json.loads(line.strip())
-            product = jsonobj["product"]
-            shop_id = product["shop_id"]
-            product_id = product["product_id"]
-            shop2products[shop_id].append(product_id)
+    for product in tqdm(iter_products(config["documents_file"]), desc="Load `shop -> products` mappings: "):
+        shop_id = product["shop_id"]
+        product_id = product["product_id"]
+        shop2products[shop_id].append(product_id)
     return shop2products
 
 
 def load_pids(config: dict) -> list:
     products = []
-    total = int(
-        os.popen(f"wc -l {config['documents_file']}").read().strip().split(" ", 1)[0]
-    )
-    with open(config["documents_file"], "r") as fin:
-        for line in tqdm(fin, total=total, desc="Load products: "):
-            jsonobj = json.loads(line.strip())
-            product = jsonobj["product"]
-            product_id = product["product_id"]
-            products.append(product_id)
+    for product in tqdm(iter_products(config["documents_file"]), desc="Load products: "):
+        product_id = product["product_id"]
+        products.append(product_id)
     return products
 
 
@@ -468,12 +460,8 @@ def synthesize_web(config: dict):
     with open(config["synthesize_prompt_file"], "r") as fin:
         prompt_template = fin.read().strip()
     
-    total = int(os.popen(f"wc -l {config['documents_file']}").read().strip().split(" ", 1)[0])
-    with open(config["documents_file"], "r") as fin, open(config["synthesize_file"], "w") as fout:
-        lines = fin.readlines()
-        for line in tqdm(lines[:100]):
-            jsonobj = json.loads(line.strip())
-            product = jsonobj["product"]
+    with open(config["synthesize_file"], "w") as fout:
+        for product in tqdm(itertools.islice(iter_products(config["documents_file"]), 100), total=100):
             reward, _ = generate_target_product(product)
             index = 1
             requirement = []
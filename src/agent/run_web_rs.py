@@ -4,19 +4,19 @@ from collections import defaultdict
 
 import tiktoken
 from tqdm import tqdm
-from pyserini.search.lucene import LuceneSearcher
 
 from run_evaluate import (
     load_rollout_outputs,
     load_synthesize_web_rewards,
+    searcher,
     extract_recommed_product
 )
 from rewards.orm import length_reward, web_rule_score_reward, web_response_score_reward
 from rewards.prm import format_reward
 from util.message import Message, OUTPUT_ROLES
+from util.trace import get_user_prompt
 
 
-searcher = LuceneSearcher("indexes")
 enc = tiktoken.encoding_for_model("gpt-4o")
 
 def eval_web(score, output, reward, kw):
@@ -142,7 +142,7 @@ def reject_sample(config: dict):
             format_ns.add(query)
 
             system_prompt = [x["content"] for x in step["prompt"] if x["role"] == "system"][0]
-            user_prompt = [x["content"] for x in step["prompt"] if x["role"] == "user"][0]
+            user_prompt = get_user_prompt(step["prompt"])
             data = {
                 "instruction": system_prompt,
                 "input": user_prompt,
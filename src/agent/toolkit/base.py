@@ -1,3 +1,5 @@
+import asyncio
+
 import ujson as json
 from pydantic import BaseModel
 
@@ -10,5 +12,9 @@ class BaseTool(BaseModel):
     def execute(self, **kwargs):
         raise NotImplementedError()
 
+    async def aexecute(self, **kwargs):
+        # tools without a native async implementation run on a thread
+        return await asyncio.to_thread(self.execute, **kwargs)
+
     def to_string(self):
         return f"Name: {self.name}\nDescription: {self.description}\nParameters: {json.dumps(self.parameters)}"
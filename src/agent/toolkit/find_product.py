@@ -1,10 +1,7 @@
-import time
 import logging
-from urllib.parse import quote_plus
-
-import requests
 
 from .base import BaseTool
+from util.http_client import request_search_engine, arequest_search_engine
 
 
 TIMEOUT = 60
@@ -58,20 +55,13 @@ class FindProduct(BaseTool):
     }
 
     def _execute(self, data):
-        for i in range(MAX_RETRIES):
-            try:
-                resp = self._request(data)
-                if resp.status_code == 200:
-                    results = self._parse_response(resp)
-                    return results
-            except Exception as e:
-                logger.error(
-                    f"Parse lazada search response error, retry {i+1}/{MAX_RETRIES}"
-                )
-                logger.error("Exception: {}".format(e))
-                time.sleep(3)
+        try:
+            resp = self._request(data)
+            return self._parse_response(resp)
+        except Exception as e:
+            logger.error("Lazada search error: {}".format(e))
 
-    def _request(self, data):
+    def _get_params(self, data):
         params = {
             "q": data["q"],
             "page": data["page"],
@@ -82,8 +72,6 @@ class FindProduct(BaseTool):
         }
 
         # preprocess
-        params["q"] = quote_plus(params["q"])
-
         if not params["shop_id"]:
             params.pop("shop_id")
 
@@ -100,15 +88,21 @@ class FindProduct(BaseTool):
                 x for x in params["service"].split(",") if x != "default"
             )
 
-        # url
-        url = "http://127.0.0.1:5631/find_product?"
-        url += "&".join("{}={}".format(str(k), str(v)) for k, v in params.items())
+        return params
 
-        # request
-        return requests.get(url, timeout=TIMEOUT)
+    def _request(self, data):
+        # pooled keep-alive session, requests encodes the query string
+        return request_search_engine("GET", "/find_product", MAX_RETRIES, params=self._get_params(data), timeout=TIMEOUT)
 
     def _parse_response(self, response):
         return response.json()
 
     def execute(self, **kwargs):
         return self._execute(kwargs)
+
+    async def aexecute(self, **kwargs):
+        try:
+            resp = await arequest_search_engine("GET", "/find_product", MAX_RETRIES, params=self._get_params(kwargs), timeout=TIMEOUT)
+            return self._parse_response(resp)
+        except Exception as e:
+            logger.error("Lazada search error: {}".format(e))
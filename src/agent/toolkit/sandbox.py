@@ -0,0 +1,114 @@
+import os
+import sys
+import queue
+import builtins
+import threading
+import multiprocessing
+from io import StringIO
+
+
+# Pre-forked worker processes that run python_execute code snippets. A worker
+# runs one snippet at a time with fresh globals, and is replaced after a
+# timeout, a crash or MAX_EXECUTIONS snippets, so state leaking between
+# snippets (imports, modified modules) stays bounded. Workers are started by a
+# forkserver, not forked from the multithreaded rollout process whose locks
+# may be held by another thread, and there is one per core (at least 4) by
+# default, so that concurrent tool calls do not queue on the pool.
+POOL_SIZE = int(os.environ.get("PYTHON_EXECUTE_WORKERS", str(max(4, os.cpu_count() or 1))))
+MAX_EXECUTIONS = int(os.environ.get("PYTHON_EXECUTE_MAX_EXECUTIONS", "100"))
+
+
+def run_code(code: str) -> dict:
+    result = {"observation": "", "success": False}
+    original_stdout = sys.stdout
+    try:
+        output_buffer = StringIO()
+        sys.stdout = output_buffer
+        safe_globals = {"__builtins__": builtins.__dict__.copy()}
+        exec(code, safe_globals, safe_globals)
+        output = output_buffer.getvalue()
+        if not output:
+            raise Exception("No output produced by the code. Please use print() calls to output results.")
+        result["observation"] = output
+        result["success"] = True
+    except Exception as e:
+        result["observation"] = str(e)
+        result["success"] = False
+    finally:
+        sys.stdout = original_stdout
+    return result
+
+
+def worker_main(conn):
+    # SystemExit and the like end the worker, the pool sees a crash
+    while True:
+        try:
+            code = conn.recv()
+        except EOFError:
+            break
+        conn.send(run_code(code))
+
+
+class SandboxWorker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.proc = ctx.Process(target=worker_main, args=(child_conn,), daemon=True)
+        self.proc.start()
+        child_conn.close()
+        self.executions = 0
+
+    def kill(self):
+        self.conn.close()
+        if self.proc.is_alive():
+            self.proc.kill()
+        self.proc.join(1)
+
+
+class SandboxPool:
+    def __init__(self, size: int = POOL_SIZE, max_executions: int = MAX_EXECUTIONS):
+        self.ctx = multiprocessing.get_context("forkserver")
+        self.max_executions = max_executions
+        self.idle = queue.Queue()
+        for _ in range(size):
+            self.idle.put(SandboxWorker(self.ctx))
+
+    def execute(self, code: str, timeout: float) -> dict:
+        worker = self.idle.get()
+        try:
+            worker.conn.send(code)
+            if not worker.conn.poll(timeout):
+                worker.kill()
+                worker = None
+                return {
+                    "observation": f"Execution timeout after {timeout} seconds",
+                    "success": False,
+                }
+            result = worker.conn.recv()
+            worker.executions += 1
+            return result
+        except (EOFError, OSError):
+            # the snippet took the worker down
+            worker.kill()
+            worker = None
+            return {"observation": "", "success": False}
+        finally:
+            self.release(worker)
+
+    def release(self, worker):
+        if worker is not None and (worker.executions >= self.max_executions or not worker.proc.is_alive()):
+            worker.kill()
+            worker = None
+        self.idle.put(worker if worker is not None else SandboxWorker(self.ctx))
+
+
+pool = None
+pool_lock = threading.Lock()
+
+
+def get_pool() -> SandboxPool:
+    # created on first use, so that importing the toolkit starts no process
+    global pool
+    with pool_lock:
+        if pool is None:
+            pool = SandboxPool()
+        return pool
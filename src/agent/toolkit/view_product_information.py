@@ -1,9 +1,7 @@
-import time
 import logging
 
-import requests
-
 from .base import BaseTool
+from util.http_client import request_search_engine, arequest_search_engine
 
 
 TIMEOUT = 60
@@ -29,33 +27,32 @@ class ViewProductInformation(BaseTool):
     }
 
     def _execute(self, data):
-        for i in range(MAX_RETRIES):
-            try:
-                resp = self._request(data)
-                if resp.status_code == 200:
-                    results = self._parse_response(resp)
-                    return results
-            except Exception as e:
-                logger.error(
-                    f"Parse lazada search response error, retry {i+1}/{MAX_RETRIES}"
-                )
-                logger.error("Exception: {}".format(e))
-                time.sleep(3)
-
-    def _request(self, data):
-        params = {
+        try:
+            resp = self._request(data)
+            return self._parse_response(resp)
+        except Exception as e:
+            logger.error("Lazada view product information error: {}".format(e))
+
+    def _get_payload(self, data):
+        return {
             "product_ids": data["product_ids"],
         }
 
-        # url
-        url = "http://127.0.0.1:5631/view_product_information?"
-        url += "&".join("{}={}".format(str(k), str(v)) for k, v in params.items())
-
-        # request
-        return requests.get(url, timeout=TIMEOUT)
+    def _request(self, data):
+        # POST so that long product_id lists are not cut by the query string limit
+        return request_search_engine("POST", "/view_product_information/batch", MAX_RETRIES, json=self._get_payload(data), timeout=TIMEOUT)
 
     def _parse_response(self, response):
         return response.json()
 
     def execute(self, **kwargs):
         return self._execute(kwargs)
+
+    async def aexecute(self, **kwargs):
+        try:
+            resp = await arequest_search_engine(
+                "POST", "/view_product_information/batch", MAX_RETRIES, json=self._get_payload(kwargs), timeout=TIMEOUT
+            )
+            return self._parse_response(resp)
+        except Exception as e:
+            logger.error("Lazada view product information error: {}".format(e))
@@ -4,12 +4,20 @@ import logging
 
 import json
 import asyncio
-import requests
+import weakref
+
+import httpx
 
 from toolkit.base import BaseTool
+from toolkit.web_search_cache import WebSearchCache
 
 MAX_RETRIES = 3
 
+TIMEOUT = 60
+
+# serper has its own connections, so slow web searches never hold the pool of the search engine
+POOL_SIZE = int(os.environ.get("WEB_SEARCH_POOL_SIZE", "16"))
+
 DESC = """Search for information using the web search engine and return the search results"""
 
 Q_DESC = """The query used to search for information. e.g. "PopMart latest news"."""
@@ -18,6 +26,19 @@ MAX_RESULTS_DESC = """The maximum number of results to return, ranging from 1 to
 
 logger = logging.getLogger(__name__)
 
+cache = WebSearchCache()
+# httpx.AsyncClient is bound to the event loop it was first used on
+clients = weakref.WeakKeyDictionary()
+
+
+def get_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE))
+        clients[loop] = client
+    return client
+
 
 class WebSearch(BaseTool):
     name: str = "web_search"
@@ -32,47 +53,56 @@ class WebSearch(BaseTool):
     }
 
     async def _execute(self, data):
+        # serper answers with the same organic results whatever max_results is,
+        # so it is applied after the cache lookup
+        request = {"q": data["q"]}
+        max_results = data.get("max_results", 10)
+        organic = cache.get(request)
+        if organic is not None:
+            return {"observation": self._format_results(organic, max_results), "success": True}
+        if cache.mode == "replay":
+            logger.error(f"Web search replay miss: {data['q']}")
+            return {"observation": [], "success": False}
+
         for i in range(MAX_RETRIES):
             try:
-                results = await self._serper_search(data)
-                return {"observation": results, "success": True}
+                organic = await self._serper_search(request)
+                cache.put(request, organic)
+                return {"observation": self._format_results(organic, max_results), "success": True}
             except Exception as e:
                 logger.error(f"Google search error: {e}")
                 logger.error(f"Retrying {i + 1}/{MAX_RETRIES}...")
         return {"observation": [], "success": False}
 
-    async def _serper_search(self, data):
+    async def _serper_search(self, request):
         url = "https://google.serper.dev/search"
 
-        payload = json.dumps({
-        "q": data["q"]
-        })
-        max_results = data.get("max_results", 10)
+        payload = json.dumps(request)
         headers = {
-        'X-API-KEY': os.environ.get("SERPER_KEY"),
+        'X-API-KEY': os.environ.get("SERPER_KEY", ""),
         'Content-Type': 'application/json'
         }
+        # raise on failures, so that they are retried and never cached
+        response = await get_client().post(url, headers=headers, content=payload, timeout=TIMEOUT)
+        response.raise_for_status()
+        return json.loads(response.text).get("organic", [])
+
+    def _format_results(self, organic, max_results):
         try:
-            loop = asyncio.get_running_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: requests.post(url, headers=headers, data=payload)
-            )
-            results = json.loads(response.text)
-
-            results = [
-                    {
-                        "url": item["link"],
-                        "title": item["title"],
-                        "content": item["snippet"],
-                    }
-                    for item in results['organic'][:max_results]
-                ]
-        except Exception as e:
-            print(f"测试过程中发生错误: {e}")
-            return []
-        
-        return results
-
-    async def execute(self, **kwargs):
+            max_results = int(max_results)
+        except (TypeError, ValueError):
+            max_results = 10
+        return [
+            {
+                "url": item.get("link", ""),
+                "title": item.get("title", ""),
+                "content": item.get("snippet", ""),
+            }
+            for item in organic[:max_results]
+        ]
+
+    def execute(self, **kwargs):
+        return asyncio.run(self.aexecute(**kwargs))
+
+    async def aexecute(self, **kwargs):
         return await self._execute(kwargs)
@@ -0,0 +1,57 @@
+import os
+import json
+import hashlib
+import logging
+
+
+# Persistent, content-addressed store of serper organic results, so that the
+# web benchmark reruns are fast, deterministic and can run offline.
+#   off:    always query serper, store nothing
+#   cache:  serve stored results, query serper and store on a miss
+#   record: always query serper and store (refresh)
+#   replay: serve stored results only, a miss fails without any network call
+MODES = ["off", "cache", "record", "replay"]
+CACHE_MODE = os.environ.get("WEB_SEARCH_CACHE_MODE", "cache")
+CACHE_DIR = os.environ.get("WEB_SEARCH_CACHE_DIR", "web_search_cache")
+
+logger = logging.getLogger(__name__)
+
+
+class WebSearchCache:
+    def __init__(self, cache_dir: str = CACHE_DIR, mode: str = CACHE_MODE):
+        if mode not in MODES:
+            raise ValueError(f"WEB_SEARCH_CACHE_MODE must be one of {MODES}, got {mode}")
+        self.cache_dir = cache_dir
+        self.mode = mode
+
+    @staticmethod
+    def get_key(request: dict) -> str:
+        # hash of the request sent to serper
+        return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, request: dict):
+        if self.mode not in ("cache", "replay"):
+            return None
+        path = self.get_path(self.get_key(request))
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as fin:
+                return json.load(fin)["organic"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Broken web search cache entry {path}: {e}")
+            return None
+
+    def put(self, request: dict, organic: list):
+        if self.mode == "off" or self.mode == "replay":
+            return
+        path = self.get_path(self.get_key(request))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # concurrent rollout processes may record the same query
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fout:
+            json.dump({"request": request, "organic": organic}, fout, ensure_ascii=False)
+        os.replace(tmp_path, path)
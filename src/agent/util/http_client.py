@@ -0,0 +1,165 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# one keep-alive connection pool per process for the product search engine
+SEARCH_SERVER_URL = os.environ.get("SEARCH_SERVER_URL", "http://127.0.0.1:5631")
+POOL_SIZE = int(os.environ.get("SEARCH_SERVER_POOL_SIZE", "32"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 10
+# consecutive failures before the breaker opens, and seconds it stays open
+# before a single probe request is let through
+BREAKER_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_MAX) -> float:
+    # exponential backoff with full jitter
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            # half open: one request at a time probes the server
+            if not self.probing and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def release(self):
+        # every allowed request ends here, whatever took it down (cancelled,
+        # unexpected error): a probe without a recorded outcome lets the next
+        # request probe instead of keeping the breaker open for good
+        with self.lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                if self.opened_at is None or self.probing:
+                    logger.error(f"Circuit breaker open after {self.failures} failures, retry in {self.reset_timeout}s")
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    @property
+    def is_open(self) -> bool:
+        with self.lock:
+            return self.opened_at is not None
+
+
+session = None
+session_lock = threading.Lock()
+breaker = CircuitBreaker()
+# httpx.AsyncClient is bound to the event loop it was first used on
+async_clients = weakref.WeakKeyDictionary()
+
+
+def get_session() -> requests.Session:
+    global session
+    with session_lock:
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        return session
+
+
+def request_search_engine(method: str, path: str, max_retries: int, **kwargs) -> requests.Response:
+    # a 200 response; connection errors and 502-504 (server down, loading) are
+    # retried with jittered backoff and count towards the breaker, which fails
+    # fast while open
+    error = None
+    for i in range(max_retries):
+        if not breaker.allow():
+            raise CircuitOpenError(f"search engine at {SEARCH_SERVER_URL} is unavailable")
+        try:
+            resp = get_session().request(method, f"{SEARCH_SERVER_URL}{path}", **kwargs)
+            if resp.status_code == 200:
+                breaker.record_success()
+                return resp
+            error = Exception(f"HTTP {resp.status_code}: {resp.text[:200]}")
+            if resp.status_code <= 500:
+                # the server is up and answered, the request itself is bad (an
+                # error on model input is a 500 as well), retrying will not help
+                breaker.record_success()
+                raise error
+            breaker.record_failure()
+        except requests.exceptions.RequestException as e:
+            error = e
+            breaker.record_failure()
+        finally:
+            breaker.release()
+        logger.error(f"Search engine request {path} error, retry {i+1}/{max_retries}: {error}")
+        if i + 1 < max_retries:
+            time.sleep(backoff_delay(i))
+    raise error
+
+
+def get_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE))
+        async_clients[loop] = client
+    return client
+
+
+async def arequest_search_engine(method: str, path: str, max_retries: int, **kwargs) -> httpx.Response:
+    # async counterpart of request_search_engine(), sharing its circuit breaker
+    error = None
+    for i in range(max_retries):
+        if not breaker.allow():
+            raise CircuitOpenError(f"search engine at {SEARCH_SERVER_URL} is unavailable")
+        try:
+            resp = await get_async_client().request(method, f"{SEARCH_SERVER_URL}{path}", **kwargs)
+            if resp.status_code == 200:
+                breaker.record_success()
+                return resp
+            error = Exception(f"HTTP {resp.status_code}: {resp.text[:200]}")
+            if resp.status_code <= 500:
+                breaker.record_success()
+                raise error
+            breaker.record_failure()
+        except httpx.HTTPError as e:
+            error = e
+            breaker.record_failure()
+        finally:
+            breaker.release()
+        logger.error(f"Search engine request {path} error, retry {i+1}/{max_retries}: {error}")
+        if i + 1 < max_retries:
+            await asyncio.sleep(backoff_delay(i))
+    raise error
@@ -1,15 +1,99 @@
 import os
 import time
+import asyncio
 import logging
+import threading
+import weakref
+from email.utils import parsedate_to_datetime
 
-from openai import OpenAI
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+
+from util.http_client import backoff_delay
 
 
 MAX_RETRIES = 10
+# keep-alive connections per client, one client per (base_url, api_key)
+POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "256"))
+KEEPALIVE_EXPIRY = 60
+BACKOFF_BASE = 1
+BACKOFF_MAX = 30
+# upper bound on a Retry-After sent by the server
+RETRY_AFTER_MAX = 120
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger()
 
+clients = dict()
+clients_lock = threading.Lock()
+# AsyncOpenAI holds an httpx.AsyncClient, which is bound to its event loop
+async_clients = weakref.WeakKeyDictionary()
+
+
+def get_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=POOL_SIZE,
+        max_keepalive_connections=POOL_SIZE,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def get_client_key(base_url: str = None, api_key: str = None) -> tuple[str, str]:
+    return (
+        base_url if base_url else os.environ.get("OPENAI_BASE_URL"),
+        api_key if api_key else os.environ.get("OPENAI_API_KEY"),
+    )
+
+
+def get_client(base_url: str = None, api_key: str = None) -> OpenAI:
+    key = get_client_key(base_url, api_key)
+    with clients_lock:
+        client = clients.get(key)
+        if client is None:
+            # retries are done by ask_llm, not by the sdk
+            client = OpenAI(
+                base_url=key[0],
+                api_key=key[1],
+                max_retries=0,
+                http_client=DefaultHttpxClient(limits=get_limits()),
+            )
+            clients[key] = client
+        return client
+
+
+def get_async_client(base_url: str = None, api_key: str = None) -> AsyncOpenAI:
+    key = get_client_key(base_url, api_key)
+    loop_clients = async_clients.setdefault(asyncio.get_running_loop(), dict())
+    client = loop_clients.get(key)
+    if client is None:
+        client = AsyncOpenAI(
+            base_url=key[0],
+            api_key=key[1],
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=get_limits()),
+        )
+        loop_clients[key] = client
+    return client
+
+
+def get_retry_delay(error: Exception, attempt: int) -> float:
+    # the Retry-After of a 429 / 503 response if any, else jittered backoff
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return min(RETRY_AFTER_MAX, float(headers["retry-after-ms"]) / 1000)
+        if "retry-after" in headers:
+            retry_after = headers["retry-after"]
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            return min(RETRY_AFTER_MAX, max(0, delay))
+    except (TypeError, ValueError):
+        pass
+    return backoff_delay(attempt, BACKOFF_BASE, BACKOFF_MAX)
+
 
 def chat_completion_stream(client: OpenAI, messages: list[dict[str, str]], model_config: dict):
     stream = client.chat.completions.create(
@@ -60,14 +144,10 @@ def ask_llm(
     base_url: str = None,
     api_key: str = None,
 ) -> tuple[str, str]:
+    client = get_client(base_url, api_key)
     success = False
     for i in range(MAX_RETRIES):
         try:
-            client = OpenAI(
-                base_url=base_url if base_url else os.environ.get("OPENAI_BASE_URL"),
-                api_key=api_key if api_key else os.environ.get("OPENAI_API_KEY"),
-            )
-
             if model_config.get("stream", False):
                 reasoning_content, content = chat_completion_stream(
                     client, messages, model_config
@@ -84,9 +164,7 @@ def ask_llm(
                 raise Exception("reasoning_content and content is empty")
         except Exception as e:
             logger.error(f"Error occurred: {e}. Retry {i+1}/{MAX_RETRIES}.")
-            time.sleep(3)
-        finally:
-            client.close()
+            time.sleep(get_retry_delay(e, i))
 
     if not success:
         logger.error(f"Retry {MAX_RETRIES} but can't success!")
@@ -95,6 +173,107 @@ def ask_llm(
     return reasoning_content, content
 
 
+def get_usage(usage) -> dict:
+    # prompt tokens served from the prefix cache, reported by vLLM / SGLang
+    # (--enable-cache-report) and OpenAI as prompt_tokens_details.cached_tokens
+    if usage is None:
+        return {}
+    result = {"prompt_tokens": usage.prompt_tokens}
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None)
+    if cached_tokens is not None:
+        result["cached_tokens"] = cached_tokens
+        if usage.prompt_tokens:
+            result["prefix_hit_rate"] = cached_tokens / usage.prompt_tokens
+    return result
+
+
+async def achat_completion_stream(client: AsyncOpenAI, messages: list[dict[str, str]], model_config: dict, extra_headers: dict = None):
+    stream = await client.chat.completions.create(
+        messages=messages,
+        extra_headers={"Accept": "text/event-stream", **(extra_headers or {})},
+        **model_config,
+    )
+
+    reasoning_content = ""
+    content = ""
+    usage = None
+    async for event in stream:
+        # only sent with "stream_options": {"include_usage": true}
+        if getattr(event, "usage", None) is not None:
+            usage = event.usage
+        try:
+            reasoning_content += event.choices[0].delta.reasoning_content
+        except:
+            pass
+        try:
+            content += event.choices[0].delta.content
+        except:
+            pass
+
+    return reasoning_content, content, get_usage(usage)
+
+
+async def achat_completion(client: AsyncOpenAI, messages: list[dict[str, str]], model_config: dict, extra_headers: dict = None):
+    completion = await client.chat.completions.create(
+        messages=messages,
+        extra_headers={"Accept": "text/event-stream", **(extra_headers or {})},
+        **model_config,
+    )
+
+    reasoning_content = ""
+    content = ""
+    try:
+        reasoning_content = completion.choices[0].message.reasoning_content
+    except:
+        pass
+    try:
+        content = completion.choices[0].message.content
+    except:
+        pass
+
+    return reasoning_content, content, get_usage(completion.usage)
+
+
+async def aask_llm(
+    messages: list[dict[str, str]],
+    model_config: dict,
+    base_url: str = None,
+    api_key: str = None,
+    extra_headers: dict = None,
+) -> tuple[str, str, dict]:
+    # async counterpart of ask_llm() for the asyncio rollout engine, also
+    # returns the token usage of the successful attempt
+    client = get_async_client(base_url, api_key)
+    success = False
+    usage = {}
+    for i in range(MAX_RETRIES):
+        try:
+            if model_config.get("stream", False):
+                reasoning_content, content, usage = await achat_completion_stream(
+                    client, messages, model_config, extra_headers
+                )
+            else:
+                reasoning_content, content, usage = await achat_completion(
+                    client, messages, model_config, extra_headers
+                )
+
+            if reasoning_content or content:
+                success = True
+                break
+            else:
+                raise Exception("reasoning_content and content is empty")
+        except Exception as e:
+            logger.error(f"Error occurred: {e}. Retry {i+1}/{MAX_RETRIES}.")
+            await asyncio.sleep(get_retry_delay(e, i))
+
+    if not success:
+        logger.error(f"Retry {MAX_RETRIES} but can't success!")
+        reasoning_content = ""
+        content = ""
+    return reasoning_content, content, usage
+
+
 if __name__ == "__main__":
     reasoning_content, content = ask_llm(
         messages=[{"role": "user", "content": "hi"}],
@@ -0,0 +1,137 @@
+import os
+import hashlib
+import logging
+
+import portalocker
+import ujson as json
+
+
+# Sidecar index of a rollout file, one json line per rollout line:
+#   {"query_hash", "offset", "length", "steps", "terminated"}
+# appended together with the rollout line, so resuming and evaluating can
+# find the rolled out queries and seek to their trajectories without parsing
+# the whole rollout file. Rollout lines not in the index yet (files written
+# before it, or a lost index) are indexed on the next load, and an index that
+# does not match its rollout file (deleted, replaced) is rebuilt.
+INDEX_SUFFIX = ".idx"
+
+logger = logging.getLogger(__name__)
+
+
+def get_query_hash(query: str) -> str:
+    return hashlib.md5(query.encode("utf-8")).hexdigest()
+
+
+def get_entry(corpus_tracker: list[dict], offset: int, length: int) -> dict:
+    final_message = corpus_tracker[-1]["completion"]["message"] if corpus_tracker else {}
+    return {
+        "query_hash": get_query_hash(corpus_tracker[0]["extra_info"]["query"]),
+        "offset": offset,
+        "length": length,
+        "steps": len(corpus_tracker),
+        # ended with the terminate tool, not by MAX_STEPS or an empty answer
+        "terminated": any(commend["name"] == "terminate" for commend in final_message.get("tool_call", [])),
+    }
+
+
+class RolloutIndex:
+    def __init__(self, rollout_file: str):
+        self.rollout_file = rollout_file
+        self.index_file = f"{rollout_file}{INDEX_SUFFIX}"
+
+    def append(self, corpus_tracker: list[dict]):
+        # one line per finished query, locked against other rollout runs on the same file
+        line = f"{json.dumps(corpus_tracker)}\n".encode("utf-8")
+        with open(self.rollout_file, "ab") as fout:
+            portalocker.lock(fout, portalocker.LOCK_EX)
+            offset = fout.seek(0, os.SEEK_END)
+            fout.write(line)
+            fout.flush()
+            if offset == 0:
+                # a new rollout file, whatever the index holds is about an old one
+                self.remove()
+            self.write_entries([get_entry(corpus_tracker, offset, len(line))])
+            portalocker.unlock(fout)
+
+    def write_entries(self, entries: list[dict]):
+        # only called with the rollout file locked
+        try:
+            with open(self.index_file, "a") as fout:
+                for entry in entries:
+                    fout.write(f"{json.dumps(entry)}\n")
+        except OSError as e:
+            logger.warning(f"Can not write rollout index {self.index_file}: {e}")
+
+    def remove(self):
+        if os.path.exists(self.index_file):
+            os.remove(self.index_file)
+
+    def read_entries(self) -> list[dict]:
+        # only called with the rollout file locked
+        entries = []
+        if not os.path.exists(self.index_file):
+            return entries
+        size = 0
+        with open(self.index_file, "rb") as fin:
+            for line in fin:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete line")
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # torn line of a killed writer, drop it and everything after
+                    logger.warning(f"Truncate rollout index {self.index_file} at a broken line")
+                    os.truncate(self.index_file, size)
+                    break
+                size += len(line)
+        return entries
+
+    def is_valid(self, fin, entry: dict) -> bool:
+        # the entry starts a complete line of its query
+        fin.seek(entry["offset"])
+        line = fin.read(entry["length"])
+        if not line.endswith(b"\n"):
+            return False
+        if entry["offset"] > 0:
+            fin.seek(entry["offset"] - 1)
+            if fin.read(1) != b"\n":
+                return False
+        try:
+            return get_entry(json.loads(line), entry["offset"], entry["length"])["query_hash"] == entry["query_hash"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            return False
+
+    def load(self) -> list[dict]:
+        # entries of every rollout line in file order, indexing the lines not in the index yet
+        if not os.path.exists(self.rollout_file):
+            self.remove()
+            return []
+        with open(self.rollout_file, "rb") as fin:
+            portalocker.lock(fin, portalocker.LOCK_EX)
+            entries = self.read_entries()
+            end = entries[-1]["offset"] + entries[-1]["length"] if entries else 0
+            size = fin.seek(0, os.SEEK_END)
+            if entries and (end > size or not self.is_valid(fin, entries[0]) or not self.is_valid(fin, entries[-1])):
+                logger.warning(f"Rollout index {self.index_file} does not match {self.rollout_file}, rebuild it")
+                entries, end = [], 0
+                self.remove()
+            if end < size:
+                fin.seek(end)
+                new_entries = []
+                for line in fin:
+                    if not line.strip():
+                        end += len(line)
+                        continue
+                    new_entries.append(get_entry(json.loads(line), end, len(line)))
+                    end += len(line)
+                self.write_entries(new_entries)
+                entries.extend(new_entries)
+            portalocker.unlock(fin)
+        return entries
+
+    def read(self, entries: list[dict]):
+        # the trajectories of the entries, by seeking to their lines
+        with open(self.rollout_file, "rb") as fin:
+            for entry in entries:
+                fin.seek(entry["offset"])
+                yield json.loads(fin.read(entry["length"]))
@@ -0,0 +1,143 @@
+import os
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+import ujson as json
+
+from util.message import generate_tool_call_id
+from util.http_client import request_search_engine, arequest_search_engine
+
+
+# Results of deterministic tool calls, keyed by the full tool_call_id hash and
+# the search index version, in memory with an optional SQLite file shared by
+# every process of a sweep.
+CACHED_TOOLS = ["find_product", "view_product_information"]
+TOOL_CACHE_SIZE = int(os.environ.get("TOOL_CACHE_SIZE", "100000"))
+# seconds between checks of the index version of the search engine
+VERSION_CHECK_INTERVAL = 60
+
+logger = logging.getLogger(__name__)
+
+
+class ToolCache:
+    def __init__(self, sqlite_file: str = None, capacity: int = TOOL_CACHE_SIZE):
+        self.sqlite_file = sqlite_file
+        self.capacity = capacity
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.conn = None
+        self.index_version = None
+        self.version_checked_at = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_index_version(self) -> str:
+        now = time.monotonic()
+        if now - self.version_checked_at >= VERSION_CHECK_INTERVAL:
+            self.version_checked_at = now
+            try:
+                resp = request_search_engine("GET", "/healthz", 1, timeout=5)
+                self.index_version = resp.json()["index_version"]
+            except Exception as e:
+                logger.error(f"Get index version error, tool cache disabled: {e}")
+                self.index_version = None
+        return self.index_version
+
+    async def aget_index_version(self) -> str:
+        # get_index_version() for the event loop, other coroutines keep the
+        # current version while the check is in flight
+        now = time.monotonic()
+        if now - self.version_checked_at >= VERSION_CHECK_INTERVAL:
+            self.version_checked_at = now
+            try:
+                resp = await arequest_search_engine("GET", "/healthz", 1, timeout=5)
+                self.index_version = resp.json()["index_version"]
+            except Exception as e:
+                logger.error(f"Get index version error, tool cache disabled: {e}")
+                self.index_version = None
+        return self.index_version
+
+    def is_cacheable(self, name: str) -> bool:
+        return name in CACHED_TOOLS and (self.capacity > 0 or bool(self.sqlite_file))
+
+    def get_key(self, name: str, parameters: dict) -> str:
+        # None when the call can not be cached
+        if not self.is_cacheable(name):
+            return None
+        index_version = self.get_index_version()
+        if not index_version:
+            return None
+        return f"{index_version}\t{name}\t{generate_tool_call_id(name, parameters, length=22)}"
+
+    async def aget_key(self, name: str, parameters: dict) -> str:
+        if not self.is_cacheable(name):
+            return None
+        index_version = await self.aget_index_version()
+        if not index_version:
+            return None
+        return f"{index_version}\t{name}\t{generate_tool_call_id(name, parameters, length=22)}"
+
+    def get_conn(self) -> sqlite3.Connection:
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.sqlite_file, timeout=30, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS tool_cache (key TEXT PRIMARY KEY, value TEXT)")
+            self.conn.commit()
+        return self.conn
+
+    def get(self, key: str):
+        with self.lock:
+            value = self.data.get(key)
+            if value is not None:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return value
+            if self.sqlite_file:
+                row = self.get_conn().execute("SELECT value FROM tool_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self.put_memory(key, value)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    async def aget(self, key: str):
+        # memory hits stay on the event loop, the SQLite tier runs on a thread
+        with self.lock:
+            value = self.data.get(key)
+            if value is not None:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return value
+            if not self.sqlite_file:
+                self.misses += 1
+                return None
+        return await asyncio.to_thread(self.get, key)
+
+    def put_memory(self, key: str, value):
+        if self.capacity <= 0:
+            return
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.capacity:
+            self.data.popitem(last=False)
+
+    def put(self, key: str, value):
+        with self.lock:
+            self.put_memory(key, value)
+            if self.sqlite_file:
+                conn = self.get_conn()
+                conn.execute("INSERT OR REPLACE INTO tool_cache (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+                conn.commit()
+
+    async def aput(self, key: str, value):
+        if self.sqlite_file:
+            await asyncio.to_thread(self.put, key, value)
+        else:
+            self.put(key, value)
@@ -0,0 +1,97 @@
+from util.message import Message, USER_ROLES, ASSISTANT_ROLES, OUTPUT_ROLES
+
+
+# Rollout steps in the "compact" trace format store only what their prompt
+# adds to the previous one: the first step holds the system prompt, each step
+# the dialogue records appended to the user prompt. expand_trace() rebuilds
+# the "prompt" of the "full" format, so the rollout file grows linearly with
+# the steps instead of holding every prompt of the dialogue. "full" stays the
+# default, readers of rollout files expect a "prompt" on every step; set
+# "trace_format": "compact" in the rollout config to opt in.
+TRACE_FORMATS = ["full", "compact"]
+# "single": [system, user=dialogue records], the layout the agent is trained on
+# "multi_turn": [system, user=query, assistant, user=obs, ...], every step only
+# appends turns, so the prompt of a step is a prefix of the next one and the
+# prefix cache of vLLM / SGLang reuses the KV of the whole dialogue
+PROMPT_LAYOUTS = ["single", "multi_turn"]
+HISTORY_HEADER = "# Dialogue Records History\n"
+HISTORY_SEPARATOR = "\n\n"
+
+
+class PromptBuilder:
+    def __init__(self):
+        self.history_messages = []
+        self.user_prompt = HISTORY_HEADER
+
+    def append(self, history_message: str):
+        if self.history_messages:
+            self.user_prompt += HISTORY_SEPARATOR
+        self.user_prompt += history_message
+        self.history_messages.append(history_message)
+
+    def update(self, message: Message) -> list[str]:
+        # same records as get_user_prompt(), returns the ones added
+        delta = []
+        for roles in (USER_ROLES, ASSISTANT_ROLES):
+            history_message = message.to_string(roles)
+            if history_message:
+                self.append(history_message)
+                delta.append(history_message)
+        return delta
+
+
+class TurnBuilder:
+    def __init__(self, system_prompt: str):
+        self.messages = [{"role": "system", "content": system_prompt}]
+
+    def update(self, message: Message, content: str) -> list[dict]:
+        # the assistant turn is the raw completion, so its KV can be reused as generated
+        delta = []
+        assistant_message = content or message.to_string(OUTPUT_ROLES)
+        if assistant_message:
+            delta.append({"role": "assistant", "content": assistant_message})
+        user_message = message.to_string(USER_ROLES + ["obs"])
+        if user_message:
+            delta.append({"role": "user", "content": user_message})
+        self.messages.extend(delta)
+        return delta
+
+
+def compact_step(step: dict, system_prompt: str, delta: list, prompt_layout: str = "single") -> dict:
+    # delta: dialogue records of PromptBuilder, or turns of TurnBuilder
+    prompt_delta = {"messages": delta} if prompt_layout == "multi_turn" else {"history": delta}
+    if step["extra_info"]["step"] == 1:
+        prompt_delta["system"] = system_prompt
+    return {"prompt_delta": prompt_delta, **step}
+
+
+def expand_trace(corpus_tracker: list[dict]) -> list[dict]:
+    # in place; steps already in the full format are left as they are
+    system_prompt = None
+    builder = PromptBuilder()
+    turns = []
+    for step in corpus_tracker:
+        prompt_delta = step.pop("prompt_delta", None)
+        if prompt_delta is None:
+            continue
+        system_prompt = prompt_delta.get("system", system_prompt)
+        if "messages" in prompt_delta:
+            turns.extend(prompt_delta["messages"])
+            step["prompt"] = [{"role": "system", "content": system_prompt}, *turns]
+            continue
+        for history_message in prompt_delta["history"]:
+            builder.append(history_message)
+        step["prompt"] = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": builder.user_prompt},
+        ]
+    return corpus_tracker
+
+
+def get_user_prompt(prompt: list[dict]) -> str:
+    # the dialogue of a step's "prompt" as the user prompt of the "single"
+    # layout; the turns of the "multi_turn" layout are joined as its records
+    turns = [message["content"] for message in prompt if message["role"] != "system"]
+    if len(turns) == 1 and turns[0].startswith(HISTORY_HEADER):
+        return turns[0]
+    return HISTORY_HEADER + HISTORY_SEPARATOR.join(turns)
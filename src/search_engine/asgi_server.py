@@ -0,0 +1,145 @@
+import os
+import ujson as json
+import multiprocessing
+from contextlib import asynccontextmanager
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
+
+import server
+import metrics
+
+
+BATCH_THREADS = int(os.getenv("BATCH_THREADS", str(max(4, multiprocessing.cpu_count()))))
+MAX_BATCH_SIZE = 1000
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    server.save_caches()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def json_response(result, status_code=200):
+    return Response(content=json.dumps(result), status_code=status_code, media_type="application/json")
+
+
+async def read_json(request: Request):
+    # None for a malformed body, like request.get_json(silent=True) of Flask
+    try:
+        return json.loads(await request.body())
+    except ValueError:
+        return None
+
+
+@app.get("/")
+async def index():
+    usage = {
+        "/find_product": "q,page,shop_id,price,sort,service",
+        "/find_product/batch": "POST [{q,page,shop_id,price,sort,service}], threads",
+        "/view_product_information": "product_ids,fields",
+        "/view_product_information/batch": "POST {product_ids,fields}",
+        "/stats": "",
+        "/metrics": "",
+        "/healthz": "",
+        "/doc/batch": "POST {product_ids}",
+    }
+    return json_response(usage)
+
+
+@app.middleware("http")
+async def wait_ready(request: Request, call_next):
+    if request.url.path not in server.UNGATED_PATHS and not await run_in_threadpool(server.ready.wait, server.READY_TIMEOUT):
+        return json_response({"error": "indexes are loading"}, status_code=503)
+    return await call_next(request)
+
+
+@app.get("/healthz")
+async def healthz():
+    if not server.ready.is_set():
+        return json_response({"status": "loading"}, status_code=503)
+    return json_response(
+        {
+            "status": "ready",
+            "num_docs": server.searcher.num_docs,
+            "index_version": server.get_index_version("indexes"),
+            "product_store": server.product_store is not None,
+        }
+    )
+
+
+@app.get("/stats")
+async def stats():
+    return json_response({"result_cache": server.result_cache.stats(), "product_cache": server.product_cache.stats()})
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/find_product")
+async def find_product(request: Request):
+    result = await run_in_threadpool(
+        server.search,
+        q=request.query_params.get("q"),
+        page=request.query_params.get("page"),
+        shop_id=request.query_params.get("shop_id"),
+        price=request.query_params.get("price"),
+        sort=request.query_params.get("sort"),
+        service=request.query_params.get("service"),
+    )
+    return json_response(result)
+
+
+@app.post("/find_product/batch")
+async def find_product_batch(request: Request):
+    items = await read_json(request)
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return json_response({"error": "expect a list of find_product parameter objects"}, status_code=400)
+    if len(items) > MAX_BATCH_SIZE:
+        return json_response({"error": f"at most {MAX_BATCH_SIZE} queries per batch"}, status_code=400)
+
+    threads = request.query_params.get("threads")
+    threads = min(max(int(threads), 1), BATCH_THREADS) if threads and threads.isdigit() else BATCH_THREADS
+    result = await run_in_threadpool(server.search_batch, items, threads)
+    return json_response(result)
+
+
+@app.get("/view_product_information")
+async def view_product_information(request: Request):
+    result = await run_in_threadpool(
+        server.information,
+        product_ids=request.query_params.get("product_ids"),
+        fields=request.query_params.get("fields"),
+    )
+    return json_response(result)
+
+
+@app.post("/view_product_information/batch")
+async def view_product_information_batch(request: Request):
+    data = await read_json(request)
+    if not isinstance(data, dict):
+        return json_response({"error": "expect an object with product_ids and fields"}, status_code=400)
+    result = await run_in_threadpool(server.information, product_ids=data.get("product_ids") or [], fields=data.get("fields"))
+    return json_response(result)
+
+
+@app.post("/doc/batch")
+async def doc_batch(request: Request):
+    data = await read_json(request)
+    if not isinstance(data, dict):
+        return json_response({"error": "expect an object with product_ids"}, status_code=400)
+    result = await run_in_threadpool(server.raw_documents, data.get("product_ids") or [])
+    return json_response(result)
+
+
+if __name__ == "__main__":
+    host = os.getenv("HOST", "0.0.0.0")
+    port = int(os.getenv("PORT", "5631"))
+
+    server.start_loading()
+    uvicorn.run(app, host=host, port=port, timeout_keep_alive=60)
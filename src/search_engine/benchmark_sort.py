@@ -0,0 +1,78 @@
+import sys
+import time
+import argparse
+
+import numpy as np
+
+import server
+from product_store import SORT_ORDERS
+
+
+# Compares the default post-hoc sort of the first 50 relevant products
+# (SORT_MODE=rerank) with the precomputed global sort orders (SORT_MODE=global).
+DEFAULT_QUERIES = [
+    "red nike shoes",
+    "backpack for college student",
+    "wireless earphones",
+    "phone case",
+    "rice cooker",
+    "baby diapers",
+    "lipstick",
+    "gaming mouse",
+]
+
+
+def run(queries: list, sort: str, mode: str, repeat: int) -> tuple:
+    server.SORT_MODE = mode
+    latencies = []
+    results = []
+    for q in queries:
+        q, shop_id, price, sort, service = server.process_search_args(q, None, None, sort, None)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            products = server.search_products(q, shop_id, price, sort, service)
+            latencies.append((time.perf_counter() - start) * 1000)
+        results.append([product["product_id"] for product in products])
+    return latencies, results
+
+
+def report(name: str, latencies: list):
+    p50, p95 = np.percentile(latencies, [50, 95])
+    print(f"{name:<20} mean {np.mean(latencies):8.2f} ms  p50 {p50:8.2f} ms  p95 {p95:8.2f} ms")
+
+
+def benchmark(queries: list, repeat: int):
+    if server.product_store is None or not server.product_store.ranks:
+        print("The product store with sort orders is required, run build_index.sh first.", file=sys.stderr)
+        sys.exit(1)
+
+    # warm up lucene and the page cache
+    run(queries, None, "rerank", 1)
+
+    for sort in SORT_ORDERS:
+        rerank_latencies, rerank_results = run(queries, sort, "rerank", repeat)
+        global_latencies, global_results = run(queries, sort, "global", repeat)
+
+        overlaps = []
+        for a, b in zip(rerank_results, global_results):
+            overlaps.append(len(set(a) & set(b)) / len(set(a) | set(b)) if a or b else 1.0)
+
+        print(f"sort={sort}")
+        report("rerank", rerank_latencies)
+        report("global", global_latencies)
+        print(f"{'result overlap':<20} mean jaccard {np.mean(overlaps):.3f}, identical {sum(a == b for a, b in zip(rerank_results, global_results))}/{len(queries)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries_file", default=None, help="one query per line")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries_file:
+        with open(args.queries_file, "r") as fin:
+            queries = [line.strip() for line in fin if line.strip()]
+
+    server.load_indexes()
+    benchmark(queries, args.repeat)
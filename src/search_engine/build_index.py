@@ -0,0 +1,200 @@
+import os
+import sys
+import shutil
+import hashlib
+import argparse
+import subprocess
+import ujson as json
+import multiprocessing as mp
+
+from tqdm import tqdm
+
+from filter_fields import FILTER_FIELDS, get_filter_fields
+from document_reader import resolve_documents_file, is_compressed, iter_lines
+from convert_products_to_documents import split_chunks, iter_chunk_lines
+
+
+# product_id -> md5 of its document line, written next to the index so that an
+# incremental build only re-indexes documents whose content changed
+MANIFEST_SUFFIX = ".manifest.tsv"
+DELETE_BATCH_SIZE = 10000
+
+# set in the workers of an incremental build, see init_manifest()
+manifest = dict()
+
+
+def get_manifest_file(index_dir: str) -> str:
+    return f"{index_dir.rstrip('/')}{MANIFEST_SUFFIX}"
+
+
+def load_manifest(manifest_file: str) -> dict:
+    result = dict()
+    if not os.path.exists(manifest_file):
+        return result
+    with open(manifest_file, "r") as fin:
+        for line in fin:
+            product_id, content_hash = line.rstrip("\n").split("\t")
+            result[product_id] = content_hash
+    return result
+
+
+def save_manifest(manifest_file: str, hashes: dict):
+    with open(f"{manifest_file}.tmp", "w") as fout:
+        for product_id, content_hash in hashes.items():
+            fout.write(f"{product_id}\t{content_hash}\n")
+    os.replace(f"{manifest_file}.tmp", manifest_file)
+
+
+def init_manifest(old_manifest: dict):
+    global manifest
+    manifest = old_manifest
+
+
+def write_document(line: bytes, fout, hashes: dict, changed: list):
+    # copy a document whose hash is not in the manifest into a shard file
+    line = line.rstrip(b"\n")
+    doc = json.loads(line)
+    product_id = str(doc["id"])
+    content_hash = hashlib.md5(line).hexdigest()
+    hashes[product_id] = content_hash
+    if manifest.get(product_id) == content_hash:
+        return
+    changed.append(product_id)
+    if "product" in doc and not all(field in doc for field in FILTER_FIELDS):
+        doc.update(get_filter_fields(doc["product"]))
+        line = json.dumps(doc).encode("utf-8")
+    fout.write(line + b"\n")
+
+
+def write_shard(args: tuple) -> tuple:
+    chunk, shard_file = args
+    hashes = dict()
+    changed = []
+    with open(shard_file, "wb") as fout:
+        for line in iter_chunk_lines(*chunk):
+            write_document(line, fout, hashes, changed)
+    return chunk[2] - chunk[1], hashes, changed
+
+
+def split_shards_stream(documents_file: str, shard_dir: str, shards: int, old_manifest: dict) -> tuple:
+    # compressed input can not be split by byte ranges, deal lines round-robin
+    init_manifest(old_manifest)
+    os.makedirs(shard_dir, exist_ok=True)
+    fouts = [open(os.path.join(shard_dir, f"shard_{i:04d}.jsonl"), "wb") for i in range(shards)]
+    hashes = dict()
+    changed = []
+    try:
+        for i, line in enumerate(tqdm(iter_lines(documents_file), desc="Split shards: ")):
+            write_document(line, fouts[i % shards], hashes, changed)
+    finally:
+        for fout in fouts:
+            fout.close()
+    return hashes, changed
+
+
+def split_shards(documents_file: str, shard_dir: str, shards: int, old_manifest: dict) -> tuple:
+    os.makedirs(shard_dir, exist_ok=True)
+    size = os.path.getsize(documents_file)
+    chunks = split_chunks(documents_file, max(1, -(-size // shards)))
+    tasks = [(chunk, os.path.join(shard_dir, f"shard_{i:04d}.jsonl")) for i, chunk in enumerate(chunks)]
+
+    hashes = dict()
+    changed = []
+    with mp.Pool(shards, initializer=init_manifest, initargs=(old_manifest,)) as pool, tqdm(
+        total=size, unit="B", unit_scale=True, desc="Split shards: "
+    ) as pbar:
+        for num_bytes, shard_hashes, shard_changed in pool.imap(write_shard, tasks):
+            hashes.update(shard_hashes)
+            changed.extend(shard_changed)
+            pbar.update(num_bytes)
+    return hashes, changed
+
+
+def run_indexer(shard_dir: str, index_dir: str, threads: int, append: bool = False):
+    # anserini indexes the shard files on `threads` threads into one IndexWriter,
+    # so the shards are merged into a single index as they are built
+    cmd = [
+        sys.executable, "-m", "pyserini.index.lucene",
+        "--collection", "JsonCollection",
+        "--input", shard_dir,
+        "--index", index_dir,
+        "--generator", "DefaultLuceneDocumentGenerator",
+        "--threads", str(threads),
+        "--storePositions", "--storeDocvectors", "--storeRaw",
+    ]
+    if append:
+        cmd.append("--append")
+    else:
+        cmd.append("--optimize")
+    subprocess.run(cmd, check=True)
+
+
+def delete_documents(index_dir: str, product_ids: list):
+    from pyserini.pyclass import autoclass
+
+    JFile = autoclass("java.io.File")
+    JFSDirectory = autoclass("org.apache.lucene.store.FSDirectory")
+    JIndexWriter = autoclass("org.apache.lucene.index.IndexWriter")
+    JIndexWriterConfig = autoclass("org.apache.lucene.index.IndexWriterConfig")
+    JOpenMode = autoclass("org.apache.lucene.index.IndexWriterConfig$OpenMode")
+    JTieredMergePolicy = autoclass("org.apache.lucene.index.TieredMergePolicy")
+    JTerm = autoclass("org.apache.lucene.index.Term")
+
+    # by default forceMergeDeletes() leaves segments with up to 10% deleted docs alone
+    merge_policy = JTieredMergePolicy()
+    merge_policy.setForceMergeDeletesPctAllowed(0.0)
+    config = JIndexWriterConfig()
+    config.setOpenMode(JOpenMode.APPEND)
+    config.setMergePolicy(merge_policy)
+    writer = JIndexWriter(JFSDirectory.open(JFile(index_dir).toPath()), config)
+    try:
+        for start in tqdm(range(0, len(product_ids), DELETE_BATCH_SIZE), desc="Delete documents: "):
+            writer.deleteDocuments([JTerm("id", pid) for pid in product_ids[start : start + DELETE_BATCH_SIZE]])
+        # keep lucene docids dense, the product store is keyed by them
+        writer.forceMergeDeletes()
+        writer.commit()
+    finally:
+        writer.close()
+
+
+def build_index(documents_file: str, index_dir: str, shards: int, incremental: bool):
+    manifest_file = get_manifest_file(index_dir)
+    shard_dir = f"{index_dir.rstrip('/')}.shards"
+    shutil.rmtree(shard_dir, ignore_errors=True)
+
+    if incremental and not (os.path.isdir(index_dir) and os.path.exists(manifest_file)):
+        print(f"No index or manifest at {index_dir}, fall back to a full build.", file=sys.stderr)
+        incremental = False
+
+    old_manifest = load_manifest(manifest_file) if incremental else dict()
+    documents_file = resolve_documents_file(documents_file)
+    if is_compressed(documents_file):
+        hashes, changed = split_shards_stream(documents_file, shard_dir, shards, old_manifest)
+    else:
+        hashes, changed = split_shards(documents_file, shard_dir, shards, old_manifest)
+
+    if incremental:
+        removed = [pid for pid in old_manifest if pid not in hashes]
+        updated = [pid for pid in changed if pid in old_manifest]
+        print(f"Added: {len(changed) - len(updated)}, updated: {len(updated)}, removed: {len(removed)}", file=sys.stderr)
+        if updated or removed:
+            delete_documents(index_dir, updated + removed)
+        if changed:
+            run_indexer(shard_dir, index_dir, shards, append=True)
+    else:
+        shutil.rmtree(index_dir, ignore_errors=True)
+        os.makedirs(index_dir)
+        run_indexer(shard_dir, index_dir, shards)
+
+    save_manifest(manifest_file, hashes)
+    shutil.rmtree(shard_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("documents_file")
+    parser.add_argument("index_dir")
+    parser.add_argument("--shards", type=int, default=mp.cpu_count())
+    parser.add_argument("--incremental", action="store_true")
+    args = parser.parse_args()
+    build_index(args.documents_file, args.index_dir, args.shards, args.incremental)
@@ -0,0 +1,84 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, capacity: int, ttl: float = 0):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expire_at = item
+            if expire_at and expire_at < time.monotonic():
+                self.data.pop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+        expire_at = time.monotonic() + self.ttl if self.ttl > 0 else 0
+        with self.lock:
+            self.data[key] = (value, expire_at)
+            self.data.move_to_end(key)
+            while len(self.data) > self.capacity:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def items(self) -> list:
+        # unexpired (key, value, seconds to live or 0), least recently used first
+        now = time.monotonic()
+        with self.lock:
+            return [
+                (key, value, expire_at - now if expire_at else 0)
+                for key, (value, expire_at) in self.data.items()
+                if not expire_at or expire_at >= now
+            ]
+
+    def load(self, items: list):
+        # inverse of items(); loaded entries count as older than the ones
+        # cached since startup
+        now = time.monotonic()
+        with self.lock:
+            for key, value, ttl in reversed(items):
+                if key in self.data:
+                    continue
+                self.data[key] = (value, now + ttl if ttl else 0)
+                self.data.move_to_end(key, last=False)
+            while len(self.data) > self.capacity:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.data),
+                "capacity": self.capacity,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -3,17 +3,20 @@ import sys
 import html
 import copy
 import ujson as json
+import multiprocessing as mp
 from collections import defaultdict, Counter
 
 from tqdm import tqdm
 
+from filter_fields import get_filter_fields
 
-products_file = sys.argv[1]
-documents_file = sys.argv[2]
-total_num_lines = int(os.popen(f"wc -l {products_file}").read().strip().split(" ", 1)[0])
 
-attr_k_counter = Counter()
-attr_v_counter = Counter()
+CHUNK_BYTES = 64 * 1024 * 1024
+LONGTAIL_THRESHOLD = 20
+
+# set in the workers of the second pass, see init_longtail_filter()
+valid_attr_ks = set()
+valid_attr_vs = set()
 
 
 def is_contain_rubbish_words(text: str):
@@ -137,129 +140,185 @@ def merge_attributes(processed_spu: dict, processed_cpv: dict) -> dict:
     return result
 
 
-def process_products():
-    with open(products_file, "r") as fin, open(f"{products_file}.processed", "w") as fout:
-        for line in tqdm(fin, total=total_num_lines):
-            p = json.loads(line.strip())
-            product = dict()
-
-            # id
-            product["product_id"] = p["product_id"]
-            product["shop_id"] = p["shop_id"]
-
-            # brand
-            product["brand"] = process_brand(p["brand_name"])
-
-            # category
-            product["category"] = p["category_hierarchy"].replace("-", " > ")
-
-            # text
-            product["title"] = process_text(p["title"])
-            product["short_description"] = process_text(p["short_description"])
-            product["description"] = process_text(p["description"])
-            product["specification"] = process_text(p["specification"])
-
-            # price
-            product["price"] = float(p["price"])
-
-            # sold count
-            product["sold_count"] = int(p["sold_cnt"])
-
-            # Stock Keeping Unit Options
-            sku_options = process_sku(p["sku"])
-            product["sku_options"] = sku_options
-            for _, kv in sku_options.items():
-                for k, v in kv.items():
-                    attr_k_counter[k] += 1
-                    attr_v_counter[v] += 1
-
-            # attributes
-            processed_spu = process_spu(p["spu"])
-            processed_cpv = process_cpv(p["cpv"])
-            attributes = merge_attributes(processed_spu, processed_cpv)
-            product["attributes"] = attributes
-            for k, vs in attributes.items():
-                attr_k_counter[k] += 1
-                for v in vs:
-                    attr_v_counter[v] += 1
-
-            # main image url
-            product["main_image_url"] = p["main_image_url"]
-
-            # product url
-            product["product_url"] = p["product_url"]
-
-            # service
-            product["service"] = p["service"]
-
-            fout.write(json.dumps(product) + "\n")
-
-
-def filter_longtail_attrs():
-    threshold = 20
-    with open(f"{products_file}.processed", "r") as fin, open(f"{products_file}.processed.tmp", "w") as fout:
-        for line in tqdm(fin, total=total_num_lines):
-            product = json.loads(line.strip())
-
-            sku_options = product["sku_options"]
-            new_sku_options = dict()
-            index = 1
-            for _, kv in sku_options.items():
-                new_kv = dict()
-                for k, v in kv.items():
-                    if attr_k_counter[k] >= threshold and attr_v_counter[v] >= threshold:
-                        new_kv[k] = v
-                if new_kv:
-                    new_sku_options[index] = new_kv
-                    index += 1
-            product["sku_options"] = new_sku_options
- 
-            attributes = product["attributes"]
-            new_attributes = dict()
-            for k, vs in attributes.items():
-                if attr_k_counter[k] < threshold:
-                    continue
-                new_vs = []
-                for v in vs:
-                    if attr_v_counter[v] < threshold:
-                        continue
-                    new_vs.append(v)
-                if new_vs:
-                    new_attributes[k] = new_vs
-            product["attributes"] = new_attributes
-
-            fout.write(f"{json.dumps(product)}\n")
-    os.system(f"mv {products_file}.processed.tmp {products_file}.processed")
-
-
-def write_documents():
-    with open(f"{products_file}.processed", "r") as fin, open(f"{documents_file}.tmp", "w") as fout:
-        for line in tqdm(fin, total=total_num_lines):
-            p = json.loads(line.strip())
-
-            contents = []
-            contents.append(p["title"])
-
-            sku_values = set()
-            for kv in p["sku_options"].values():
-                for v in kv.values():
-                    sku_values.add(v)
-            contents.append(" ".join(sku_values))
-
-            attributes = set()
-            for vs in p["attributes"].values():
-                for v in vs:
-                    attributes.add(v)
-            contents.append(" ".join(attributes))
-
-            doc = {"id": p["product_id"], "contents": "\n".join(contents), "product": p}
-            fout.write(json.dumps(doc) + "\n")
-
-    os.system(f"mv {documents_file}.tmp {documents_file}")
-    os.system(f"rm -rf {products_file}.processed")
+def convert_product(p: dict) -> dict:
+    product = dict()
+
+    # id
+    product["product_id"] = p["product_id"]
+    product["shop_id"] = p["shop_id"]
+
+    # brand
+    product["brand"] = process_brand(p["brand_name"])
+
+    # category
+    product["category"] = p["category_hierarchy"].replace("-", " > ")
+
+    # text
+    product["title"] = process_text(p["title"])
+    product["short_description"] = process_text(p["short_description"])
+    product["description"] = process_text(p["description"])
+    product["specification"] = process_text(p["specification"])
+
+    # price
+    product["price"] = float(p["price"])
+
+    # sold count
+    product["sold_count"] = int(p["sold_cnt"])
+
+    # Stock Keeping Unit Options
+    product["sku_options"] = process_sku(p["sku"])
+
+    # attributes
+    processed_spu = process_spu(p["spu"])
+    processed_cpv = process_cpv(p["cpv"])
+    product["attributes"] = merge_attributes(processed_spu, processed_cpv)
+
+    # main image url
+    product["main_image_url"] = p["main_image_url"]
+
+    # product url
+    product["product_url"] = p["product_url"]
+
+    # service
+    product["service"] = p["service"]
+
+    return product
+
+
+def count_attrs(product: dict, attr_k_counter: Counter, attr_v_counter: Counter):
+    for _, kv in product["sku_options"].items():
+        for k, v in kv.items():
+            attr_k_counter[k] += 1
+            attr_v_counter[v] += 1
+
+    for k, vs in product["attributes"].items():
+        attr_k_counter[k] += 1
+        for v in vs:
+            attr_v_counter[v] += 1
+
+
+def filter_longtail_attrs(product: dict) -> dict:
+    sku_options = product["sku_options"]
+    new_sku_options = dict()
+    index = 1
+    for _, kv in sku_options.items():
+        new_kv = dict()
+        for k, v in kv.items():
+            if k in valid_attr_ks and v in valid_attr_vs:
+                new_kv[k] = v
+        if new_kv:
+            new_sku_options[index] = new_kv
+            index += 1
+    product["sku_options"] = new_sku_options
+
+    attributes = product["attributes"]
+    new_attributes = dict()
+    for k, vs in attributes.items():
+        if k not in valid_attr_ks:
+            continue
+        new_vs = []
+        for v in vs:
+            if v not in valid_attr_vs:
+                continue
+            new_vs.append(v)
+        if new_vs:
+            new_attributes[k] = new_vs
+    product["attributes"] = new_attributes
+    return product
+
+
+def convert_to_document(p: dict) -> dict:
+    contents = []
+    contents.append(p["title"])
+
+    sku_values = set()
+    for kv in p["sku_options"].values():
+        for v in kv.values():
+            sku_values.add(v)
+    contents.append(" ".join(sku_values))
+
+    attributes = set()
+    for vs in p["attributes"].values():
+        for v in vs:
+            attributes.add(v)
+    contents.append(" ".join(attributes))
+
+    doc = {"id": p["product_id"], "contents": "\n".join(contents), "product": p}
+    doc.update(get_filter_fields(p))
+    return doc
+
+
+def split_chunks(filepath: str, chunk_bytes: int = CHUNK_BYTES) -> list:
+    size = os.path.getsize(filepath)
+    return [(filepath, start, min(start + chunk_bytes, size)) for start in range(0, size, chunk_bytes)]
+
+
+def iter_chunk_lines(filepath: str, start: int, end: int):
+    # a chunk owns every line that starts inside [start, end)
+    with open(filepath, "rb") as fin:
+        if start > 0:
+            fin.seek(start - 1)
+            fin.readline()
+        while fin.tell() < end:
+            line = fin.readline()
+            if not line:
+                break
+            if line.strip():
+                yield line
+
+
+def count_chunk(chunk: tuple) -> tuple:
+    attr_k_counter = Counter()
+    attr_v_counter = Counter()
+    for line in iter_chunk_lines(*chunk):
+        count_attrs(convert_product(json.loads(line)), attr_k_counter, attr_v_counter)
+    return chunk[2] - chunk[1], attr_k_counter, attr_v_counter
+
+
+def init_longtail_filter(attr_ks: set, attr_vs: set):
+    global valid_attr_ks, valid_attr_vs
+    valid_attr_ks = attr_ks
+    valid_attr_vs = attr_vs
+
+
+def convert_chunk(chunk: tuple) -> tuple:
+    documents = []
+    for line in iter_chunk_lines(*chunk):
+        product = filter_longtail_attrs(convert_product(json.loads(line)))
+        documents.append(json.dumps(convert_to_document(product)) + "\n")
+    return chunk[2] - chunk[1], "".join(documents)
+
+
+def convert_products_to_documents(products_file: str, documents_file: str, workers: int):
+    chunks = split_chunks(products_file)
+    total = os.path.getsize(products_file)
+
+    # pass 1: clean products in parallel and merge the partial attribute counters
+    attr_k_counter = Counter()
+    attr_v_counter = Counter()
+    with mp.Pool(workers) as pool, tqdm(total=total, unit="B", unit_scale=True, desc="Count attributes: ") as pbar:
+        for num_bytes, k_counter, v_counter in pool.imap_unordered(count_chunk, chunks):
+            attr_k_counter.update(k_counter)
+            attr_v_counter.update(v_counter)
+            pbar.update(num_bytes)
+
+    attr_ks = {k for k, cnt in attr_k_counter.items() if cnt >= LONGTAIL_THRESHOLD}
+    attr_vs = {v for v, cnt in attr_v_counter.items() if cnt >= LONGTAIL_THRESHOLD}
+    del attr_k_counter, attr_v_counter
+
+    # pass 2: filter long-tail attributes and write documents in input order
+    with mp.Pool(workers, initializer=init_longtail_filter, initargs=(attr_ks, attr_vs)) as pool, open(
+        f"{documents_file}.tmp", "w"
+    ) as fout, tqdm(total=total, unit="B", unit_scale=True, desc="Write documents: ") as pbar:
+        for num_bytes, documents in pool.imap(convert_chunk, chunks):
+            fout.write(documents)
+            pbar.update(num_bytes)
+
+    os.replace(f"{documents_file}.tmp", documents_file)
 
 
 if __name__ == "__main__":
-    process_products()
-    filter_longtail_attrs()
-    write_documents()
+    products_file = sys.argv[1]
+    documents_file = sys.argv[2]
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else mp.cpu_count()
+    convert_products_to_documents(products_file, documents_file, workers)
@@ -0,0 +1,51 @@
+import io
+import os
+import gzip
+import ujson as json
+
+
+# Streams documents.jsonl(.gz|.zst) without a separate decompression step.
+BLOCK_SIZE = 16 * 1024 * 1024
+COMPRESSED_SUFFIXES = [".gz", ".zst"]
+
+
+def resolve_documents_file(path: str) -> str:
+    if os.path.exists(path):
+        return path
+    for suffix in COMPRESSED_SUFFIXES:
+        if os.path.exists(path + suffix):
+            return path + suffix
+    raise FileNotFoundError(f"Documents file not found: {path}")
+
+
+def is_compressed(path: str) -> bool:
+    return any(path.endswith(suffix) for suffix in COMPRESSED_SUFFIXES)
+
+
+def open_documents(path: str):
+    path = resolve_documents_file(path)
+    if path.endswith(".gz"):
+        return io.BufferedReader(gzip.open(path, "rb"), buffer_size=BLOCK_SIZE)
+    if path.endswith(".zst"):
+        import zstandard
+
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_size=BLOCK_SIZE, closefd=True)
+        return io.BufferedReader(stream, buffer_size=BLOCK_SIZE)
+    return open(path, "rb", buffering=BLOCK_SIZE)
+
+
+def iter_lines(path: str):
+    with open_documents(path) as fin:
+        for line in fin:
+            if line.strip():
+                yield line
+
+
+def iter_documents(path: str):
+    for line in iter_lines(path):
+        yield json.loads(line)
+
+
+def iter_products(path: str):
+    for doc in iter_documents(path):
+        yield doc["product"]
@@ -0,0 +1,66 @@
+import os
+import sys
+import math
+import ujson as json
+
+from tqdm import tqdm
+
+
+# Top-level document fields indexed next to `contents` so that `/find_product`
+# filters can be pushed down into the Lucene query instead of being applied
+# after decoding every hit.
+SHOP_ID_FIELD = "shop_id"
+PRICE_FIELD = "price"
+SERVICE_FIELD = "service"
+FILTER_FIELDS = [SHOP_ID_FIELD, PRICE_FIELD, SERVICE_FIELD]
+
+# price is indexed as a zero-padded integer number of cents, so that a
+# lexicographic TermRangeQuery behaves like a numeric range query
+PRICE_SCALE = 100
+PRICE_WIDTH = 15
+
+
+def encode_price(price: float) -> str:
+    return str(int(round(price * PRICE_SCALE))).zfill(PRICE_WIDTH)
+
+
+def encode_price_bound(price: float, is_low: bool) -> str:
+    cents = price * PRICE_SCALE
+    cents = math.ceil(cents - 1e-6) if is_low else math.floor(cents + 1e-6)
+    # clamped to the encoded range, so that the bound compares as a string of PRICE_WIDTH digits
+    return str(min(max(cents, 0), 10**PRICE_WIDTH - 1)).zfill(PRICE_WIDTH)
+
+
+def get_filter_fields(product: dict) -> dict:
+    return {
+        SHOP_ID_FIELD: str(product["shop_id"]),
+        PRICE_FIELD: encode_price(product["price"]),
+        SERVICE_FIELD: " ".join(product.get("service", [])),
+    }
+
+
+def has_filter_fields(documents_file: str) -> bool:
+    with open(documents_file, "r") as fin:
+        line = fin.readline()
+    if not line.strip():
+        return True
+    doc = json.loads(line.strip())
+    return all(field in doc for field in FILTER_FIELDS)
+
+
+def add_filter_fields(documents_file: str):
+    if has_filter_fields(documents_file):
+        print(f"{documents_file} already has filter fields, skip.", file=sys.stderr)
+        return
+
+    total = int(os.popen(f"wc -l {documents_file}").read().strip().split(" ", 1)[0])
+    with open(documents_file, "r") as fin, open(f"{documents_file}.tmp", "w") as fout:
+        for line in tqdm(fin, total=total, desc="Add filter fields: "):
+            doc = json.loads(line.strip())
+            doc.update(get_filter_fields(doc["product"]))
+            fout.write(json.dumps(doc) + "\n")
+    os.replace(f"{documents_file}.tmp", documents_file)
+
+
+if __name__ == "__main__":
+    add_filter_fields(sys.argv[1])
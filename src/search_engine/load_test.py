@@ -0,0 +1,223 @@
+import os
+import sys
+import glob
+import time
+import shutil
+import argparse
+import itertools
+import threading
+import subprocess
+import ujson as json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from build_index import build_index
+from document_reader import iter_lines
+from product_store import build_product_store
+
+
+# Replays the find_product / view_product_information tool calls recorded in
+# rollout files against a search server at a target QPS and concurrency, and
+# reports latency percentiles, throughput and error rates per endpoint.
+TOOLS = ["find_product", "view_product_information"]
+TIMEOUT = 60
+SERVER_START_TIMEOUT = 600
+
+
+def load_tool_calls(rollout_files: list, limit: int = None) -> list:
+    calls = []
+    for rollout_file in rollout_files:
+        with open(rollout_file, "r") as fin:
+            for line in fin:
+                for step in json.loads(line.strip()):
+                    message = step["completion"]["message"]
+                    for commend in message.get("tool_call", []):
+                        if commend["name"] in TOOLS and isinstance(commend.get("parameters"), dict):
+                            calls.append((commend["name"], commend["parameters"]))
+                if limit and len(calls) >= limit:
+                    return calls[:limit]
+    return calls
+
+
+def get_find_product_params(parameters: dict) -> dict:
+    # the same preprocessing as toolkit/find_product.py
+    params = {"q": parameters.get("q"), "page": parameters.get("page")}
+    for k in ["shop_id", "price", "sort", "service"]:
+        v = parameters.get(k)
+        if not v or v == "default":
+            continue
+        if k == "service":
+            v = ",".join(x for x in str(v).split(",") if x != "default")
+        params[k] = v
+    return params
+
+
+local = threading.local()
+
+
+def get_session() -> requests.Session:
+    if not hasattr(local, "session"):
+        local.session = requests.Session()
+    return local.session
+
+
+def send(url: str, name: str, parameters: dict, scheduled: float = None) -> tuple:
+    # -> (name, latency in seconds, error or None), measured from the scheduled
+    # time when given, so that queueing behind busy workers is not hidden
+    session = get_session()
+    start = scheduled or time.perf_counter()
+    try:
+        if name == "find_product":
+            resp = session.get(f"{url}/find_product", params=get_find_product_params(parameters), timeout=TIMEOUT)
+        else:
+            resp = session.post(
+                f"{url}/view_product_information/batch",
+                json={"product_ids": parameters.get("product_ids")},
+                timeout=TIMEOUT,
+            )
+        resp.json()
+        error = None if resp.status_code == 200 else f"http {resp.status_code}"
+    except Exception as e:
+        error = type(e).__name__
+    return name, time.perf_counter() - start, error
+
+
+def run_load(url: str, calls: list, qps: float, concurrency: int, duration: float, num_requests: int) -> tuple:
+    # open loop when qps > 0, requests are scheduled at fixed intervals and the
+    # latency includes the time a request waited for a free worker; closed loop
+    # (as fast as `concurrency` workers allow) otherwise
+    schedule = itertools.islice(itertools.cycle(calls), num_requests) if num_requests else itertools.cycle(calls)
+    futures = []
+    slots = threading.Semaphore(concurrency)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for i, (name, parameters) in enumerate(schedule):
+            now = time.perf_counter()
+            if duration and now - start >= duration:
+                break
+            if qps > 0:
+                scheduled = start + i / qps
+                if scheduled > now:
+                    time.sleep(scheduled - now)
+                futures.append(executor.submit(send, url, name, parameters, scheduled))
+            else:
+                slots.acquire()
+                future = executor.submit(send, url, name, parameters)
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+
+    results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def report(results: list, elapsed: float):
+    print(f"{'endpoint':<26} {'requests':>9} {'errors':>8} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name in TOOLS + ["total"]:
+        current = [r for r in results if name in ("total", r[0])]
+        if not current:
+            continue
+        latencies = [latency * 1000 for _, latency, error in current if error is None] or [0.0]
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        errors = sum(error is not None for _, _, error in current)
+        print(
+            f"{name:<26} {len(current):>9} {errors / len(current):>7.2%} {len(current) / elapsed:>9.1f} "
+            f"{p50:>9.2f} {p95:>9.2f} {p99:>9.2f} {max(latencies):>9.2f}"
+        )
+
+    errors = dict()
+    for _, _, error in results:
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+    for error, count in sorted(errors.items(), key=lambda x: -x[1]):
+        print(f"error {error}: {count}")
+
+
+def prepare_sample(documents_file: str, work_dir: str, sample: int, shards: int):
+    # index the first `sample` documents into work_dir/indexes and work_dir/product_store
+    os.makedirs(work_dir, exist_ok=True)
+    sample_file = os.path.join(work_dir, "documents.jsonl")
+    with open(sample_file, "wb") as fout:
+        for line in itertools.islice(iter_lines(documents_file), sample):
+            fout.write(line if line.endswith(b"\n") else line + b"\n")
+    index_dir = os.path.join(work_dir, "indexes")
+    store_dir = os.path.join(work_dir, "product_store")
+    build_index(sample_file, index_dir, shards, incremental=False)
+    shutil.rmtree(store_dir, ignore_errors=True)
+    build_product_store(index_dir, store_dir)
+
+
+def start_server(work_dir: str, port: int, server_args: list, warmup: bool = False) -> subprocess.Popen:
+    # no cache snapshot, so that every run starts from the same cold result /
+    # product caches, and the server's own warm-up only when asked for
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+    log = open(os.path.join(work_dir, "server.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, script] + server_args,
+        cwd=work_dir,
+        env={**os.environ, "HOST": "127.0.0.1", "PORT": str(port), "SNAPSHOT_FILE": "", "WARMUP": "1" if warmup else "0"},
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    start = time.time()
+    while time.time() - start < SERVER_START_TIMEOUT:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}, see {log.name}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/healthz", timeout=1).status_code == 200:
+                return process
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"Server did not start in {SERVER_START_TIMEOUT}s, see {log.name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rollout_files", nargs="+", help="rollout jsonl files, glob patterns allowed")
+    parser.add_argument("--url", default=None, help="an already running server, e.g. http://127.0.0.1:5631")
+    parser.add_argument("--documents_file", default="resources/documents.jsonl")
+    parser.add_argument("--sample", type=int, default=100000, help="documents indexed for the local server")
+    parser.add_argument("--work_dir", default="load_test")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the sample index")
+    parser.add_argument("--port", type=int, default=5731)
+    parser.add_argument("--server_args", default="", help="extra server.py arguments, e.g. '--workers 4'")
+    parser.add_argument("--qps", type=float, default=0, help="target requests per second, 0 for closed loop")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=60, help="seconds, 0 to replay --requests calls")
+    parser.add_argument("--requests", type=int, default=0, help="number of requests, 0 for unlimited")
+    parser.add_argument("--max_calls", type=int, default=0, help="tool calls loaded from the rollout files")
+    parser.add_argument("--warmup", type=int, default=100, help="requests sent before measuring")
+    parser.add_argument("--server_warmup", action="store_true", help="let the local server prefetch the index and run its warm-up queries")
+    args = parser.parse_args()
+
+    rollout_files = [path for pattern in args.rollout_files for path in sorted(glob.glob(pattern))]
+    calls = load_tool_calls(rollout_files, args.max_calls)
+    if not calls:
+        print(f"No {' / '.join(TOOLS)} tool calls found in {rollout_files}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Loaded {len(calls)} tool calls from {len(rollout_files)} rollout files.", file=sys.stderr)
+    if not args.duration and not args.requests:
+        args.requests = len(calls)
+
+    process = None
+    url = args.url
+    if url is None:
+        if args.rebuild or not os.path.exists(os.path.join(args.work_dir, "product_store", "meta.json")):
+            prepare_sample(args.documents_file, args.work_dir, args.sample, os.cpu_count())
+        process = start_server(args.work_dir, args.port, args.server_args.split(), args.server_warmup)
+        url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        if args.warmup:
+            run_load(url, calls, 0, args.concurrency, 0, args.warmup)
+        results, elapsed = run_load(url, calls, args.qps, args.concurrency, args.duration, args.requests)
+        print(f"qps={args.qps or 'max'} concurrency={args.concurrency} elapsed={elapsed:.1f}s")
+        report(results, elapsed)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
@@ -0,0 +1,170 @@
+import os
+import sys
+import time
+import bisect
+import threading
+import ujson as json
+from contextlib import contextmanager
+
+
+# Minimal Prometheus text-format metrics plus per-request traces, so that the
+# time of a request can be split into lucene, doc fetch, json decode, filter and
+# serialization stages.
+SECONDS_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+COUNT_BUCKETS = [0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000]
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "1000"))
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: list):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.series = dict()
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            if key not in self.series:
+                self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts, _, _ = series = self.series[key]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ["+Inf"], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{format_labels(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{format_labels(key)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.series = dict()
+        self.lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.series.items()):
+                lines.append(f"{self.name}{format_labels(key)} {value}")
+        return lines
+
+
+request_seconds = Histogram("search_request_seconds", "Request latency by endpoint.", SECONDS_BUCKETS)
+stage_seconds = Histogram("search_stage_seconds", "Time spent per stage of a request.", SECONDS_BUCKETS)
+hits_scanned = Histogram("search_hits_scanned", "Lucene hits walked per request.", COUNT_BUCKETS)
+docs_decoded = Histogram("search_docs_decoded", "Raw json documents decoded per request.", COUNT_BUCKETS)
+filter_rejections = Histogram("search_filter_rejections", "Hits rejected by the filters per request.", COUNT_BUCKETS)
+cache_requests = Counter("search_cache_requests_total", "Result and product cache lookups by result.")
+slow_queries = Counter("search_slow_queries_total", "Requests slower than SLOW_QUERY_MS.")
+global_sort_truncated = Counter("search_global_sort_truncated_total", "Globally sorted queries with more matches than GLOBAL_SORT_LIMIT.")
+METRICS = [request_seconds, stage_seconds, hits_scanned, docs_decoded, filter_rejections, cache_requests, slow_queries, global_sort_truncated]
+TRACE_COUNTS = {"hits_scanned": hits_scanned, "docs_decoded": docs_decoded, "filter_rejections": filter_rejections}
+
+local = threading.local()
+
+
+class Trace:
+    def __init__(self, endpoint: str, params: dict):
+        self.endpoint = endpoint
+        self.params = params
+        self.start = time.perf_counter()
+        self.stages = dict()
+        self.counts = {name: 0 for name in TRACE_COUNTS}
+        self.rejections = dict()
+
+
+@contextmanager
+def trace(endpoint: str, **params):
+    local.trace = Trace(endpoint, params)
+    try:
+        yield local.trace
+    finally:
+        finish_trace(local.trace)
+        local.trace = None
+
+
+def finish_trace(current: Trace):
+    elapsed = time.perf_counter() - current.start
+    request_seconds.observe(elapsed, endpoint=current.endpoint)
+    for stage, seconds in current.stages.items():
+        stage_seconds.observe(seconds, endpoint=current.endpoint, stage=stage)
+    for name, value in current.counts.items():
+        TRACE_COUNTS[name].observe(value, endpoint=current.endpoint)
+
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        slow_queries.inc(endpoint=current.endpoint)
+        record = {
+            "endpoint": current.endpoint,
+            "params": current.params,
+            "ms": round(elapsed * 1000, 2),
+            "stages_ms": {stage: round(seconds * 1000, 2) for stage, seconds in current.stages.items()},
+            "counts": current.counts,
+            "rejections": current.rejections,
+        }
+        print(f"Slow query: {json.dumps(record)}", file=sys.stderr)
+
+
+def get_trace():
+    return getattr(local, "trace", None)
+
+
+def add_stage(stage: str, seconds: float):
+    current = get_trace()
+    if current is not None:
+        current.stages[stage] = current.stages.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage(name, time.perf_counter() - start)
+
+
+def count(name: str, value: int = 1):
+    current = get_trace()
+    if current is not None:
+        current.counts[name] += value
+
+
+def reject(filter_name: str, value: int = 1):
+    current = get_trace()
+    if current is not None:
+        current.counts["filter_rejections"] += value
+        current.rejections[filter_name] = current.rejections.get(filter_name, 0) + value
+
+
+def observe_serialize(endpoint: str, seconds: float):
+    stage_seconds.observe(seconds, endpoint=endpoint, stage="serialize")
+
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
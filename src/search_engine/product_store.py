@@ -0,0 +1,236 @@
+import os
+import sys
+import glob
+import ujson as json
+
+import numpy as np
+from tqdm import tqdm
+
+
+# Columnar copy of the fields `/find_product` filters, sorts and returns, keyed by
+# lucene docid, so that the search hot path never decodes the raw json documents.
+SERVICES = ["official", "freeShipping", "COD", "flashsale"]
+TEXT_FIELDS = ["product_id", "title"]
+# precomputed global orders, rank[docid] is the position of docid when the whole
+# collection is sorted that way, ties broken by docid
+SORT_ORDERS = ["order", "priceasc", "pricedesc"]
+
+
+def get_index_version(index_dir: str) -> str:
+    segments = sorted(
+        glob.glob(os.path.join(index_dir, "segments_*")),
+        key=lambda x: int(x.rsplit("_", 1)[1], 36),
+    )
+    if not segments:
+        return ""
+    return f"{os.path.basename(segments[-1])}:{os.path.getsize(segments[-1])}"
+
+
+def encode_service(service: list) -> int:
+    mask = 0
+    for i, serv in enumerate(SERVICES):
+        if serv in service:
+            mask |= 1 << i
+    return mask
+
+
+class ProductStore:
+    def __init__(self, store_dir: str):
+        with open(os.path.join(store_dir, "meta.json"), "r") as fin:
+            self.meta = json.load(fin)
+        with open(os.path.join(store_dir, "shop_ids.json"), "r") as fin:
+            self.shop_ids = json.load(fin)
+        with open(os.path.join(store_dir, "services.json"), "r") as fin:
+            self.services = json.load(fin)
+        self.shop_id2code = {shop_id: code for code, shop_id in enumerate(self.shop_ids)}
+
+        def load(name):
+            return np.load(os.path.join(store_dir, f"{name}.npy"), mmap_mode="r")
+
+        self.price = load("price")
+        self.sold_count = load("sold_count")
+        self.service_mask = load("service_mask")
+        self.service_code = load("service_code")
+        self.shop_code = load("shop_code")
+        self.sorted_product_ids = None
+        self.sorted_docids = None
+        if os.path.exists(os.path.join(store_dir, "sorted_product_ids.npy")):
+            self.sorted_product_ids = load("sorted_product_ids")
+            self.sorted_docids = load("sorted_docids")
+        self.ranks = dict()
+        for sort in SORT_ORDERS:
+            if os.path.exists(os.path.join(store_dir, f"{sort}_rank.npy")):
+                self.ranks[sort] = load(f"{sort}_rank")
+        self.texts = dict()
+        for field in TEXT_FIELDS:
+            offsets = load(f"{field}_offsets")
+            data = np.memmap(os.path.join(store_dir, f"{field}.bin"), dtype=np.uint8, mode="r") if offsets[-1] > 0 else b""
+            self.texts[field] = (offsets, data)
+
+    def __len__(self):
+        return self.meta["num_docs"]
+
+    def get_text(self, field: str, docid: int) -> str:
+        offsets, data = self.texts[field]
+        return bytes(data[offsets[docid] : offsets[docid + 1]]).decode("utf-8")
+
+    def lookup(self, product_ids: list) -> dict:
+        # product_id -> docid, by binary search over the sorted product_ids
+        if self.sorted_product_ids is None or not product_ids:
+            return None
+        width = self.sorted_product_ids.dtype.itemsize
+        keys = [pid.encode("utf-8") for pid in product_ids]
+        keys = np.array([key for key in keys if len(key) <= width], dtype=self.sorted_product_ids.dtype)
+        result = dict()
+        if len(keys) == 0:
+            return result
+        positions = np.searchsorted(self.sorted_product_ids, keys)
+        positions = np.minimum(positions, len(self.sorted_product_ids) - 1)
+        for key, position in zip(keys, positions):
+            if self.sorted_product_ids[position] == key:
+                result[key.decode("utf-8")] = int(self.sorted_docids[position])
+        return result
+
+    def filter(self, docids: np.ndarray, shop_id=None, price=None, service=None) -> np.ndarray:
+        mask = np.ones(len(docids), dtype=bool)
+        if shop_id:
+            code = self.shop_id2code.get(shop_id)
+            if code is None:
+                return docids[:0]
+            mask &= self.shop_code[docids] == code
+        low, high = price if price else (None, None)
+        if low is not None:
+            mask &= self.price[docids] >= low
+        if high is not None:
+            mask &= self.price[docids] <= high
+        if service:
+            for serv in service:
+                if serv not in SERVICES:
+                    return docids[:0]
+            required = encode_service(service)
+            mask &= (self.service_mask[docids] & required) == required
+        return docids[mask]
+
+    def sort(self, docids: np.ndarray, sort=None) -> np.ndarray:
+        # stable, like list.sort(), so ties keep their relevance order
+        if sort == "order":
+            return docids[np.argsort(-self.sold_count[docids], kind="stable")]
+        elif sort == "priceasc":
+            return docids[np.argsort(self.price[docids], kind="stable")]
+        elif sort == "pricedesc":
+            return docids[np.argsort(-self.price[docids], kind="stable")]
+        return docids
+
+    def top_k(self, docids: np.ndarray, sort: str, k: int) -> np.ndarray:
+        # the k first docids in the precomputed order, like a lucene sort on docvalues
+        ranks = self.ranks[sort][docids]
+        if len(docids) > k:
+            selected = np.argpartition(ranks, k)[:k]
+            docids, ranks = docids[selected], ranks[selected]
+        return docids[np.argsort(ranks)]
+
+    def get(self, docid: int) -> dict:
+        docid = int(docid)
+        return {
+            "product_id": self.get_text("product_id", docid),
+            "shop_id": self.shop_ids[self.shop_code[docid]],
+            "title": self.get_text("title", docid),
+            "price": float(self.price[docid]),
+            "service": self.services[self.service_code[docid]],
+            "sold_count": int(self.sold_count[docid]),
+        }
+
+
+def load_product_store(store_dir: str, index_dir: str, num_docs: int):
+    if not os.path.exists(os.path.join(store_dir, "meta.json")):
+        print(f"Product store {store_dir} not found, fall back to raw documents.", file=sys.stderr)
+        return None
+    store = ProductStore(store_dir)
+    if store.meta["num_docs"] != num_docs or store.meta["index_version"] != get_index_version(index_dir):
+        print(f"Product store {store_dir} is stale, fall back to raw documents.", file=sys.stderr)
+        return None
+    if store.meta.get("max_doc", num_docs) != num_docs:
+        # deleted docs left in the index, lucene docids are not dense
+        print(f"Index {index_dir} has deleted documents, fall back to raw documents.", file=sys.stderr)
+        return None
+    return store
+
+
+def build_product_store(index_dir: str, store_dir: str):
+    from pyserini.index.lucene import LuceneIndexReader
+    from pyserini.pyclass import autoclass
+    from pyserini.search.lucene import LuceneSearcher
+
+    JMultiBits = autoclass("org.apache.lucene.index.MultiBits")
+
+    searcher = LuceneSearcher(index_dir)
+    reader = LuceneIndexReader(index_dir).reader
+    # columns are keyed by lucene docid, so they span maxDoc, deleted docs included
+    max_doc = reader.maxDoc()
+    live_docs = JMultiBits.getLiveDocs(reader)
+
+    shop_ids, shop_id2code = [], dict()
+    services, service2code = [], dict()
+    price = np.zeros(max_doc, dtype=np.float64)
+    sold_count = np.zeros(max_doc, dtype=np.int64)
+    service_mask = np.zeros(max_doc, dtype=np.uint8)
+    service_code = np.zeros(max_doc, dtype=np.int32)
+    shop_code = np.zeros(max_doc, dtype=np.int32)
+    texts = {field: (bytearray(), np.zeros(max_doc + 1, dtype=np.int64)) for field in TEXT_FIELDS}
+
+    for docid in tqdm(range(max_doc), desc="Build product store: "):
+        if live_docs is not None and not live_docs.get(docid):
+            for field, (data, offsets) in texts.items():
+                offsets[docid + 1] = len(data)
+            continue
+        product = json.loads(searcher.doc(docid).raw())["product"]
+
+        shop_id = str(product["shop_id"])
+        if shop_id not in shop_id2code:
+            shop_id2code[shop_id] = len(shop_ids)
+            shop_ids.append(shop_id)
+        shop_code[docid] = shop_id2code[shop_id]
+
+        service = tuple(product.get("service", []))
+        if service not in service2code:
+            service2code[service] = len(services)
+            services.append(list(service))
+        service_code[docid] = service2code[service]
+        service_mask[docid] = encode_service(service)
+
+        price[docid] = product["price"]
+        sold_count[docid] = product["sold_count"]
+
+        for field, (data, offsets) in texts.items():
+            data.extend(str(product[field]).encode("utf-8"))
+            offsets[docid + 1] = len(data)
+
+    os.makedirs(store_dir, exist_ok=True)
+    np.save(os.path.join(store_dir, "price.npy"), price)
+    np.save(os.path.join(store_dir, "sold_count.npy"), sold_count)
+    np.save(os.path.join(store_dir, "service_mask.npy"), service_mask)
+    np.save(os.path.join(store_dir, "service_code.npy"), service_code)
+    np.save(os.path.join(store_dir, "shop_code.npy"), shop_code)
+    for field, (data, offsets) in texts.items():
+        np.save(os.path.join(store_dir, f"{field}_offsets.npy"), offsets)
+        with open(os.path.join(store_dir, f"{field}.bin"), "wb") as fout:
+            fout.write(data)
+    data, offsets = texts["product_id"]
+    product_ids = np.array([bytes(data[offsets[i] : offsets[i + 1]]) for i in range(max_doc)], dtype=bytes)
+    order = np.argsort(product_ids, kind="stable")
+    np.save(os.path.join(store_dir, "sorted_product_ids.npy"), product_ids[order])
+    np.save(os.path.join(store_dir, "sorted_docids.npy"), order.astype(np.int64))
+    for sort, keys in [("order", -sold_count), ("priceasc", price), ("pricedesc", -price)]:
+        rank = np.empty(max_doc, dtype=np.int32)
+        rank[np.argsort(keys, kind="stable")] = np.arange(max_doc, dtype=np.int32)
+        np.save(os.path.join(store_dir, f"{sort}_rank.npy"), rank)
+    with open(os.path.join(store_dir, "shop_ids.json"), "w") as fout:
+        json.dump(shop_ids, fout)
+    with open(os.path.join(store_dir, "services.json"), "w") as fout:
+        json.dump(services, fout)
+    with open(os.path.join(store_dir, "meta.json"), "w") as fout:
+        json.dump({"num_docs": searcher.num_docs, "max_doc": max_doc, "index_version": get_index_version(index_dir)}, fout)
+
+
+if __name__ == "__main__":
+    build_product_store(sys.argv[1], sys.argv[2])
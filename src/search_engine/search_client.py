@@ -0,0 +1,72 @@
+import os
+import sys
+
+import requests
+
+from cache import LRUCache
+
+
+# Lets the evaluate / synthesize / statistic scripts share one running server.py
+# instead of each starting a JVM and opening the indexes themselves.
+SEARCH_SERVER_URL = os.getenv("SEARCH_SERVER_URL", "http://127.0.0.1:5631")
+TIMEOUT = 60
+DOC_CACHE_SIZE = 100000
+
+
+class RemoteDocument:
+    def __init__(self, raw: str):
+        self._raw = raw
+
+    def raw(self) -> str:
+        return self._raw
+
+
+class RemoteSearcher:
+    """The `doc()` part of LuceneSearcher, answered by a running server.py."""
+
+    def __init__(self, url: str = SEARCH_SERVER_URL):
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+        self.cache = LRUCache(DOC_CACHE_SIZE)
+        health = self.session.get(f"{self.url}/healthz", timeout=TIMEOUT).json()
+        self.num_docs = health["num_docs"]
+        self.index_version = health["index_version"]
+
+    def docs(self, product_ids: list) -> dict:
+        result = dict()
+        missing = []
+        for product_id in dict.fromkeys(str(x) for x in product_ids):
+            raw = self.cache.get(product_id)
+            if raw is None:
+                missing.append(product_id)
+            else:
+                result[product_id] = raw
+        if missing:
+            resp = self.session.post(f"{self.url}/doc/batch", json={"product_ids": missing}, timeout=TIMEOUT)
+            resp.raise_for_status()
+            for product_id, raw in resp.json().items():
+                result[product_id] = raw
+                if raw is not None:
+                    self.cache.put(product_id, raw)
+        return {product_id: RemoteDocument(raw) if raw is not None else None for product_id, raw in result.items()}
+
+    def doc(self, product_id):
+        return self.docs([product_id]).get(str(product_id))
+
+
+def is_server_ready(url: str) -> bool:
+    try:
+        return requests.get(f"{url.rstrip('/')}/healthz", timeout=1).status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+
+def get_searcher(index_dir: str = "indexes"):
+    # a running and ready server.py when there is one, the index itself otherwise
+    if is_server_ready(SEARCH_SERVER_URL):
+        print(f"Use the search server at {SEARCH_SERVER_URL}.", file=sys.stderr)
+        return RemoteSearcher(SEARCH_SERVER_URL)
+
+    from pyserini.search.lucene import LuceneSearcher
+
+    return LuceneSearcher(index_dir)
@@ -1,21 +1,70 @@
 import os
 import sys
+import glob
 import ujson as json
+import math
+import time
+import signal
+import socket
+import argparse
+import itertools
+import threading
+import traceback
 import multiprocessing
+from multiprocessing.connection import wait
+from concurrent.futures import ThreadPoolExecutor
 
-from pyserini.search.lucene import LuceneSearcher
-from flask import Flask, request, jsonify
+import numpy as np
+from flask import Flask, Response, request, jsonify
 from waitress import serve
 
-searcher = LuceneSearcher("indexes")
-print("Load indexes done.", file=sys.stderr)
+from filter_fields import (
+    FILTER_FIELDS,
+    SHOP_ID_FIELD,
+    PRICE_FIELD,
+    SERVICE_FIELD,
+    encode_price_bound,
+)
+from product_store import SERVICES, SORT_ORDERS, get_index_version, load_product_store
+from cache import LRUCache
+from snapshot import save_snapshot, load_snapshot
+import metrics
 
 app = Flask(__name__)
 
+# set by load_indexes(); pyserini starts the JVM on import, which must happen
+# after the pre-fork workers are forked
+searcher = None
+analyzer = None
+querybuilder = None
+JTermRangeQuery = None
+JBagOfWordsQueryGenerator = None
+is_filter_pushdown = False
+product_store = None
+# set once the indexes are loaded and warmed up, requests wait for it
+ready = threading.Event()
+
 
 CAPACITY = 100000
+GROWTH_FACTOR = 4
+MIN_SELECTIVITY = 0.001
+SELECTIVITY_DECAY = 0.8
+STORE_BATCH_SIZE = 1000
 PAGE_SIZE = 10
 MAX_PAGE = 5
+# "rerank": sort the first MAX_PAGE * PAGE_SIZE relevant products;
+# "global": top products in the precomputed sort order over the first
+# GLOBAL_SORT_LIMIT relevant matches; every walked hit crosses pyjnius, so the
+# limit bounds the cost of a sorted query (benchmark_sort.py measures it), and
+# queries with more matches are counted in search_global_sort_truncated_total
+SORT_MODE = os.getenv("SORT_MODE", "rerank")
+GLOBAL_SORT_LIMIT = min(CAPACITY, int(os.getenv("GLOBAL_SORT_LIMIT", "10000")))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "10000"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "10000"))
+# caches are saved here on shutdown and loaded at startup, "" to disable;
+# pre-fork workers each use their own file, suffixed by the worker slot
+SNAPSHOT_FILE = os.getenv("SNAPSHOT_FILE", "cache_snapshot.msgpack")
 SEARCH_FIELDS = ["product_id", "shop_id", "title", "price", "service", "sold_count"]
 INFORMATION_FIELDS = [
     "product_id",
@@ -24,6 +73,142 @@ INFORMATION_FIELDS = [
     "sku_options",
     "attributes",
 ]
+PRODUCT_FIELDS = [
+    "product_id",
+    "shop_id",
+    "brand",
+    "category",
+    "title",
+    "short_description",
+    "description",
+    "specification",
+    "price",
+    "sold_count",
+    "sku_options",
+    "attributes",
+    "main_image_url",
+    "product_url",
+    "service",
+]
+MAX_INFORMATION_BATCH = 10000
+# the server answers while the indexes load in the background, other paths
+# block until ready for at most READY_TIMEOUT seconds
+UNGATED_PATHS = ["/", "/healthz", "/metrics", "/stats"]
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "600"))
+SHUTDOWN_TIMEOUT = 30
+# a pre-fork worker that dies before it is ready is restarted after an
+# exponential backoff, and the master gives up after MAX_LOAD_FAILURES in a
+# row, or at once when no worker has ever loaded (missing / corrupt index)
+MAX_LOAD_FAILURES = 5
+RESTART_BACKOFF_BASE = 1
+RESTART_BACKOFF_MAX = 60
+WARMUP = os.getenv("WARMUP", "1") == "1"
+WARMUP_QUERIES = ["shoes", "phone case", "red dress", "wireless earphones", "rice cooker"]
+# terms dictionary, postings, norms and field/segment infos, read by every
+# query; stored fields and doc vectors are left to the page cache
+HOT_INDEX_FILES = (".tip", ".tim", ".tmd", ".doc", ".nvd", ".nvm", ".fnm", ".si")
+
+result_cache = LRUCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+# decoded raw documents by product_id, for the fields the product store lacks
+product_cache = LRUCache(PRODUCT_CACHE_SIZE)
+# moving average of the fraction of hits that survive the python-side filters,
+# per combination of filters, used to size the first top-k search
+selectivity_estimates = dict()
+
+
+def load_indexes():
+    global searcher, analyzer, querybuilder, JTermRangeQuery, JBagOfWordsQueryGenerator
+    global is_filter_pushdown, product_store
+
+    from pyserini.analysis import get_lucene_analyzer
+    from pyserini.index.lucene import LuceneIndexReader
+    from pyserini.pyclass import autoclass
+    from pyserini.search.lucene import LuceneSearcher, querybuilder
+
+    JFieldInfos = autoclass("org.apache.lucene.index.FieldInfos")
+    JTermRangeQuery = autoclass("org.apache.lucene.search.TermRangeQuery")
+    JBagOfWordsQueryGenerator = autoclass("io.anserini.search.query.BagOfWordsQueryGenerator")
+
+    searcher = LuceneSearcher("indexes")
+    analyzer = get_lucene_analyzer()
+    field_infos = JFieldInfos.getMergedFieldInfos(LuceneIndexReader("indexes").reader)
+    is_filter_pushdown = all(field_infos.fieldInfo(field) is not None for field in FILTER_FIELDS)
+    print(f"Filter pushdown: {is_filter_pushdown}", file=sys.stderr)
+    product_store = load_product_store("product_store", "indexes", searcher.num_docs)
+
+
+def get_snapshot_file(slot=None):
+    if not SNAPSHOT_FILE:
+        return None
+    return SNAPSHOT_FILE if slot is None else f"{SNAPSHOT_FILE}.{slot}"
+
+
+def get_caches():
+    return {"result_cache": result_cache, "product_cache": product_cache}
+
+
+def save_caches(slot=None):
+    # only once loaded, a worker that failed to load must not overwrite a snapshot
+    path = get_snapshot_file(slot)
+    if path and ready.is_set():
+        save_snapshot(path, get_index_version("indexes"), get_caches())
+
+
+def load_caches(slot=None):
+    path = get_snapshot_file(slot)
+    if path:
+        load_snapshot(path, get_index_version("indexes"), get_caches(), {"result_cache": lambda key: get_cache_key(*key)})
+
+
+def prefetch_files(paths):
+    # ask the kernel to read the files into the page cache, without waiting
+    num_bytes = 0
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            num_bytes += os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+    return num_bytes
+
+
+def warm_up():
+    start = time.time()
+    paths = [path for path in glob.glob("indexes/*") if path.endswith(HOT_INDEX_FILES)]
+    if product_store is not None:
+        paths += [path for path in glob.glob("product_store/*") if os.path.isfile(path)]
+    num_bytes = prefetch_files(paths)
+    # compile the search path in the JVM, bypassing the result cache
+    for q in WARMUP_QUERIES:
+        for sort in [None] + SORT_ORDERS:
+            search_products(*process_search_args(q, None, None, sort, None))
+    print(f"Warm up done in {time.time() - start:.1f}s, prefetched {num_bytes / 2**20:.0f}MB.", file=sys.stderr)
+
+
+def start_loading(on_ready=None, slot=None):
+    # load and warm up in the background so that the server is listening, and
+    # /healthz answering, from the first second
+    def run():
+        try:
+            load_indexes()
+            load_caches(slot)
+            if WARMUP:
+                warm_up()
+        except Exception:
+            traceback.print_exc()
+            print("Load indexes failed.", file=sys.stderr, flush=True)
+            os._exit(1)
+        ready.set()
+        if on_ready is not None:
+            on_ready()
+        else:
+            print("Load indexes done.", file=sys.stderr, flush=True)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
 
 
 def convert_str_to_float(x):
@@ -51,6 +236,9 @@ def process_price(price):
     low, high = splited
     low = convert_str_to_float(low)
     high = convert_str_to_float(high)
+    # "100-inf", "nan-5": a bound that is not finite does not bound anything
+    low = low if low is not None and math.isfinite(low) else None
+    high = high if high is not None and math.isfinite(high) else None
     return [low, high]
 
 
@@ -65,7 +253,7 @@ def process_service(service):
     if not service:
         return results
     for serv in service.split(","):
-        if serv not in {"official", "freeShipping", "COD", "flashsale"}:
+        if serv not in SERVICES:
             continue
         if serv in results:
             continue
@@ -95,72 +283,400 @@ def is_filter_by_shop_id(product, shop_id):
     return False
 
 
-def search(q, page, shop_id=None, price=None, sort=None, service=None):
-    page = process_page(page)
-    price = process_price(price)
-    sort = process_sort(sort)
-    service = process_service(service)
+def build_query(q, shop_id, price, service):
+    # None when nothing can match
+    if not is_filter_pushdown or (not shop_id and price == [None, None] and not service):
+        return q
 
-    products = []
+    builder = querybuilder.get_boolean_query_builder()
+    text_query = JBagOfWordsQueryGenerator().buildQuery("contents", analyzer, q)
+    builder.add(text_query, querybuilder.JBooleanClauseOccur["must"].value)
+
+    if shop_id:
+        try:
+            shop_query = querybuilder.get_term_query(shop_id, field=SHOP_ID_FIELD, analyzer=analyzer)
+        except IndexError:
+            # analyzed to no token (a stopword, punctuation), no shop_id matches it
+            return None
+        builder.add(shop_query, querybuilder.JBooleanClauseOccur["filter"].value)
+
+    low, high = price
+    if low is not None or high is not None:
+        price_query = JTermRangeQuery.newStringRange(
+            PRICE_FIELD,
+            encode_price_bound(low, is_low=True) if low is not None else None,
+            encode_price_bound(high, is_low=False) if high is not None else None,
+            True,
+            True,
+        )
+        builder.add(price_query, querybuilder.JBooleanClauseOccur["filter"].value)
+
+    for serv in service:
+        service_query = querybuilder.get_term_query(serv, field=SERVICE_FIELD, analyzer=analyzer)
+        builder.add(service_query, querybuilder.JBooleanClauseOccur["filter"].value)
+
+    return builder.build()
 
-    # page
-    if page is None:
-        return products
 
-    # filter by shop_id & price & service
-    hits = searcher.search(q=q, k=CAPACITY, remove_dups=True)
+def get_filter_signature(shop_id, price, service):
+    low, high = price
+    return (bool(shop_id), low is not None, high is not None, len(service))
+
+
+def get_initial_k(signature, is_pushdown):
+    limit = MAX_PAGE * PAGE_SIZE
+    if is_pushdown or not any(signature):
+        return limit
+    selectivity = max(selectivity_estimates.get(signature, 1.0), MIN_SELECTIVITY)
+    return min(CAPACITY, max(limit, math.ceil(limit / selectivity)))
+
+
+def update_selectivity(signature, scanned, passed):
+    if not any(signature) or scanned == 0:
+        return
+    selectivity = passed / scanned
+    if signature in selectivity_estimates:
+        selectivity = SELECTIVITY_DECAY * selectivity_estimates[signature] + (1 - SELECTIVITY_DECAY) * selectivity
+    selectivity_estimates[signature] = selectivity
+
+
+def iter_hits(query, k, first_hits=None, limit=CAPACITY):
+    # grow k geometrically up to limit and only walk the hits not seen in the previous round
+    seen = set()
+    start = 0
+    while True:
+        if first_hits is not None:
+            hits, first_hits = first_hits, None
+        else:
+            with metrics.stage("lucene"):
+                hits = searcher.search(q=query, k=k)
+        for hit in hits[start:]:
+            if hit.docid in seen:
+                continue
+            seen.add(hit.docid)
+            metrics.count("hits_scanned")
+            yield hit
+        if len(hits) < k or k >= limit:
+            return
+        start = len(hits)
+        k = min(k * GROWTH_FACTOR, limit)
+
+
+def filter_by_store(hits, shop_id, price, service, limit=MAX_PAGE * PAGE_SIZE):
+    results = []
+    scanned = 0
+    count = 0
+    while limit is None or count < limit:
+        batch = list(itertools.islice(hits, STORE_BATCH_SIZE if count or limit is None else limit))
+        if not batch:
+            break
+        with metrics.stage("filter"):
+            docids = np.array([hit.lucene_docid for hit in batch], dtype=np.int64)
+            docids = product_store.filter(docids, shop_id, price, service)
+        metrics.reject("store", len(batch) - len(docids))
+        results.append(docids)
+        scanned += len(batch)
+        count += len(docids)
+    if not results:
+        return np.zeros(0, dtype=np.int64), scanned
+    return np.concatenate(results)[:limit], scanned
+
+
+def is_global_sort(sort):
+    return SORT_MODE == "global" and sort is not None and product_store is not None and sort in product_store.ranks
+
+
+def get_product(product_id, docid=None):
+    # the decoded raw document, looked up by lucene docid when given
+    product = product_cache.get(product_id)
+    metrics.cache_requests.inc(cache="product", result="miss" if product is None else "hit")
+    if product is None:
+        with metrics.stage("fetch"):
+            doc = searcher.doc(product_id if docid is None else docid)
+        if not doc:
+            return None
+        with metrics.stage("decode"):
+            product = json.loads(doc.raw())["product"]
+        metrics.count("docs_decoded")
+        product_cache.put(product_id, product)
+    return product
+
+
+def search_products(q, shop_id, price, sort, service, first_hits=None, k=None):
+    # filter by shop_id & price & service, pushed down into lucene when indexed;
+    # the checks below keep the results exact either way
+    query = build_query(q, shop_id, price, service)
+    if query is None:
+        return []
+    signature = get_filter_signature(shop_id, price, service)
+
+    # the first GLOBAL_SORT_LIMIT matches are candidates for a global sort, no json decoding needed
+    if is_global_sort(sort):
+        hits = iter_hits(query, GLOBAL_SORT_LIMIT, first_hits if k == GLOBAL_SORT_LIMIT else None, GLOBAL_SORT_LIMIT)
+        docids, scanned = filter_by_store(hits, shop_id, price, service, limit=None)
+        if scanned >= GLOBAL_SORT_LIMIT:
+            metrics.global_sort_truncated.inc()
+        with metrics.stage("sort"):
+            docids = product_store.top_k(docids, sort, MAX_PAGE * PAGE_SIZE)
+        with metrics.stage("project"):
+            return [product_store.get(docid) for docid in docids]
+
+    hits = iter_hits(query, k or get_initial_k(signature, query is not q), first_hits)
+
+    # columnar product store: filter, sort and project without json decoding
+    if product_store is not None:
+        docids, scanned = filter_by_store(hits, shop_id, price, service)
+        update_selectivity(signature, scanned, len(docids))
+        with metrics.stage("sort"):
+            docids = product_store.sort(docids, sort)
+        with metrics.stage("project"):
+            return [product_store.get(docid) for docid in docids]
+
+    products = []
+    scanned = 0
     for hit in hits:
-        product = json.loads(searcher.doc(hit.docid).raw())["product"]
+        scanned += 1
+        product = get_product(hit.docid)
         if is_filter_by_shop_id(product, shop_id):
+            metrics.reject("shop_id")
             continue
         if is_filter_by_price(product, price):
+            metrics.reject("price")
             continue
         if is_filter_by_service(product, service):
+            metrics.reject("service")
             continue
         products.append(product)
         if len(products) >= MAX_PAGE * PAGE_SIZE:
             break
+    update_selectivity(signature, scanned, len(products))
 
     # sort
-    if sort == "order":
-        products.sort(key=lambda x: x["sold_count"], reverse=True)
-    elif sort == "priceasc":
-        products.sort(key=lambda x: x["price"], reverse=False)
-    elif sort == "pricedesc":
-        products.sort(key=lambda x: x["price"], reverse=True)
-
-    a_page = products[(page - 1) * PAGE_SIZE : page * PAGE_SIZE]
+    with metrics.stage("sort"):
+        if sort == "order":
+            products.sort(key=lambda x: x["sold_count"], reverse=True)
+        elif sort == "priceasc":
+            products.sort(key=lambda x: x["price"], reverse=False)
+        elif sort == "pricedesc":
+            products.sort(key=lambda x: x["price"], reverse=True)
+
+    return [{k: product[k] for k in SEARCH_FIELDS} for product in products]
+
+
+def process_search_args(q, shop_id, price, sort, service):
+    # batch requests are json, the model may send numbers or null for any of them
+    q = " ".join(str(q).split()) if q is not None else ""
+    shop_id = str(shop_id) if shop_id else None
+    price, sort, service = (str(x) if x is not None else None for x in (price, sort, service))
+    return q, shop_id, process_price(price), process_sort(sort), process_service(service)
+
+
+def get_cache_key(q, shop_id, price, sort, service):
+    return (q, shop_id, tuple(price), sort, tuple(sorted(service)))
+
+
+def search(q, page, shop_id=None, price=None, sort=None, service=None):
+    page = process_page(page)
+    q, shop_id, price, sort, service = process_search_args(q, shop_id, price, sort, service)
+
+    # page, and a query with nothing to search for
+    if page is None or not q:
+        return []
+
+    with metrics.trace("find_product", q=q, page=page, shop_id=shop_id, price=price, sort=sort, service=service):
+        # all pages of a query share one cached result set
+        key = get_cache_key(q, shop_id, price, sort, service)
+        products = result_cache.get(key)
+        metrics.cache_requests.inc(cache="result", result="miss" if products is None else "hit")
+        if products is None:
+            products = search_products(q, shop_id, price, sort, service)
+            result_cache.put(key, products)
+
+        return products[(page - 1) * PAGE_SIZE : page * PAGE_SIZE]
+
+
+def search_batch(items, threads=1):
+    with metrics.trace("find_product_batch", size=len(items), threads=threads):
+        return run_search_batch(items, threads)
+
+
+def run_search_batch(items, threads=1):
+    """Run many find_product requests at once.
+
+    Cache misses whose lucene query is plain text go through a single
+    `batch_search` call; filtered queries that were pushed down into lucene are
+    searched one by one on a thread pool.
+    """
+    pages = []
+    products = dict()
+    misses = dict()
+    for item in items:
+        page = item.get("page")
+        page = process_page(str(page) if page is not None else None)
+        args = process_search_args(
+            item.get("q"), item.get("shop_id"), item.get("price"), item.get("sort"), item.get("service")
+        )
+        if not args[0]:
+            page = None
+        key = get_cache_key(*args)
+        pages.append((page, key))
+        if page is None or key in products or key in misses:
+            continue
+        cached = result_cache.get(key)
+        metrics.cache_requests.inc(cache="result", result="miss" if cached is None else "hit")
+        if cached is not None:
+            products[key] = cached
+        else:
+            misses[key] = args
+
+    plain, filtered = [], []
+    for key, (q, shop_id, price, sort, service) in misses.items():
+        if build_query(q, shop_id, price, service) is q:
+            plain.append(key)
+        else:
+            filtered.append(key)
+
+    if plain:
+        k = 0
+        for key in plain:
+            q, shop_id, price, sort, service = misses[key]
+            k = max(k, get_initial_k(get_filter_signature(shop_id, price, service), False))
+        qids = [str(i) for i in range(len(plain))]
+        with metrics.stage("lucene"):
+            batch_hits = searcher.batch_search([misses[key][0] for key in plain], qids, k=k, threads=threads)
+        for qid, key in zip(qids, plain):
+            products[key] = search_products(*misses[key], first_hits=batch_hits.get(qid, []), k=k)
+
+    if filtered:
+        with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+            for key, result in zip(filtered, executor.map(lambda key: search_products(*misses[key]), filtered)):
+                products[key] = result
+
+    for key in misses:
+        result_cache.put(key, products[key])
+
     results = []
-    for product in a_page:
-        results.append({k: product[k] for k in SEARCH_FIELDS})
+    for page, key in pages:
+        if page is None:
+            results.append([])
+        else:
+            results.append(products[key][(page - 1) * PAGE_SIZE : page * PAGE_SIZE])
     return results
 
 
-def information(product_ids, delimiter=","):
+def process_fields(fields):
+    if not fields:
+        return INFORMATION_FIELDS
+    if not isinstance(fields, list):
+        fields = str(fields).split(",")
+    return [field for field in dict.fromkeys(str(field) for field in fields) if field in PRODUCT_FIELDS]
+
+
+def fetch_products(product_ids, fields):
+    # fetch each distinct product once, in lucene docid order, and skip json
+    # decoding when the product store holds every requested field
+    products = dict()
+    docids = product_store.lookup(product_ids) if product_store is not None else None
+    if docids is None:
+        for product_id in dict.fromkeys(product_ids):
+            product = get_product(product_id)
+            if product is not None:
+                products[product_id] = product
+        return products
+
+    is_stored = all(field in SEARCH_FIELDS for field in fields)
+    for product_id, docid in sorted(docids.items(), key=lambda x: x[1]):
+        if is_stored:
+            with metrics.stage("project"):
+                products[product_id] = product_store.get(docid)
+        else:
+            products[product_id] = get_product(product_id, docid)
+    return products
+
+
+def information(product_ids, delimiter=",", fields=None):
+    if not isinstance(product_ids, list):
+        # the model may send a single number instead of a comma-separated string
+        product_ids = str(product_ids).split(delimiter) if product_ids is not None else []
+    product_ids = [str(product_id) for product_id in product_ids[:MAX_INFORMATION_BATCH]]
+    fields = process_fields(fields)
+
     results = []
+    if len(product_ids) == 0 or len(fields) == 0:
+        return results
 
-    product_ids = product_ids.split(delimiter)
-    if len(product_ids) == 0:
+    with metrics.trace("view_product_information", size=len(product_ids), fields=fields):
+        products = fetch_products(product_ids, fields)
+        for product_id in product_ids:
+            if product_id not in products:
+                continue
+            product = products[product_id]
+            results.append({k: product.get(k) for k in fields})
         return results
 
-    for product_id in product_ids:
+
+def raw_documents(product_ids):
+    # the stored documents, as LuceneSearcher.doc(product_id).raw() returns them
+    if not isinstance(product_ids, list):
+        product_ids = str(product_ids).split(",")
+    docs = dict()
+    for product_id in dict.fromkeys(str(product_id) for product_id in product_ids[:MAX_INFORMATION_BATCH]):
         doc = searcher.doc(product_id)
-        if not doc:
-            continue
-        product = json.loads(doc.raw())["product"]
-        results.append({k: product[k] for k in INFORMATION_FIELDS})
-    return results
+        docs[product_id] = doc.raw() if doc else None
+    return docs
 
 
 @app.route("/")
 def index():
     usage = {
         "/find_product": "q,page,shop_id,price,sort,service",
-        "/view_product_information": "product_ids",
+        "/view_product_information": "product_ids,fields",
+        "/view_product_information/batch": "POST {product_ids,fields}",
+        "/stats": "",
+        "/metrics": "",
+        "/healthz": "",
+        "/doc/batch": "POST {product_ids}",
     }
     return jsonify(usage)
 
 
+@app.before_request
+def wait_ready():
+    if request.path not in UNGATED_PATHS and not ready.wait(READY_TIMEOUT):
+        return jsonify({"error": "indexes are loading"}), 503
+
+
+@app.route("/healthz")
+def healthz():
+    if not ready.is_set():
+        return jsonify({"status": "loading"}), 503
+    return jsonify(
+        {
+            "status": "ready",
+            "num_docs": searcher.num_docs,
+            "index_version": get_index_version("indexes"),
+            "product_store": product_store is not None,
+        }
+    )
+
+
+@app.route("/stats")
+def stats():
+    return jsonify({"result_cache": result_cache.stats(), "product_cache": product_cache.stats()})
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def timed_jsonify(endpoint, result):
+    start = time.perf_counter()
+    response = jsonify(result)
+    metrics.observe_serialize(endpoint, time.perf_counter() - start)
+    return response
+
+
 @app.route("/find_product")
 def find_product():
     result = search(
@@ -171,28 +687,178 @@ def find_product():
         sort=request.args.get("sort"),
         service=request.args.get("service"),
     )
-    return jsonify(result)
+    return timed_jsonify("find_product", result)
 
 
 @app.route("/view_product_information")
 def view_product_information():
-    result = information(product_ids=request.args.get("product_ids"))
-    return jsonify(result)
+    result = information(product_ids=request.args.get("product_ids"), fields=request.args.get("fields"))
+    return timed_jsonify("view_product_information", result)
+
+
+@app.route("/view_product_information/batch", methods=["POST"])
+def view_product_information_batch():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "expect an object with product_ids and fields"}), 400
+    result = information(product_ids=data.get("product_ids") or [], fields=data.get("fields"))
+    return timed_jsonify("view_product_information", result)
+
+
+@app.route("/doc/batch", methods=["POST"])
+def doc_batch():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "expect an object with product_ids"}), 400
+    return jsonify(raw_documents(data.get("product_ids") or []))
+
+
+def exit_on_sigterm():
+    # unwinds serve() so that the caches are saved on the way out
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+
+def serve_worker(sock, threads, ready_pipe, slot):
+    # the master turns ctrl-c into a SIGTERM for each worker
+    exit_on_sigterm()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def on_ready():
+        ready_pipe.send(os.getpid())
+        ready_pipe.close()
+
+    start_loading(on_ready, slot)
+    try:
+        serve(
+            app,
+            sockets=[sock],
+            threads=threads,
+            expose_tracebacks=True,
+            channel_timeout=60,
+            cleanup_interval=10,
+        )
+    finally:
+        save_caches(slot)
+
+
+def serve_prefork(host, port, workers, threads):
+    # workers inherit one listening socket and share the on-disk index and the
+    # product store through the page cache
+    sock = socket.create_server((host, port), backlog=1024)
+    ctx = multiprocessing.get_context("fork")
+
+    def start_worker(slot):
+        reader, writer = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=serve_worker, args=(sock, threads, writer, slot), daemon=True)
+        proc.start()
+        writer.close()
+        slots[proc.sentinel] = slot
+        procs[proc.sentinel] = proc
+        pending[reader] = proc
+
+    procs = dict()
+    pending = dict()
+    slots = dict()
+    # sentinels of the running workers that reported ready
+    loaded = set()
+    load_failures = [0] * workers
+    # slot -> time.monotonic() to start it again
+    restarts = dict()
+
+    def stop_workers():
+        for proc in procs.values():
+            proc.terminate()
+        # leave time for the workers to save their cache snapshots
+        for proc in procs.values():
+            proc.join(SHUTDOWN_TIMEOUT)
+
+    def shutdown(signum, frame):
+        stop_workers()
+        sys.exit(0)
+
+    def receive_ready(reader):
+        proc = pending.pop(reader)
+        try:
+            reader.recv()
+            loaded.add(proc.sentinel)
+            load_failures[slots[proc.sentinel]] = 0
+        except EOFError:
+            # died while loading, handled via its sentinel
+            pass
+        finally:
+            reader.close()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    for slot in range(workers):
+        start_worker(slot)
+
+    is_ready = False
+    while True:
+        timeout = max(0, min(restarts.values()) - time.monotonic()) if restarts else None
+        for obj in wait(list(procs.keys()) + list(pending.keys()), timeout):
+            if obj in pending:
+                receive_ready(obj)
+                # a worker that died while loading also closes its pipe, count only the ready ones
+                if not is_ready and len(loaded) == workers:
+                    is_ready = True
+                    print(f"All {workers} workers ready.", file=sys.stderr)
+                    print("Load indexes done.", file=sys.stderr, flush=True)
+            elif obj in procs:
+                proc = procs.pop(obj)
+                proc.join()
+                slot = slots.pop(obj)
+                # a ready message may still be unread in its pipe
+                for reader in [reader for reader, pending_proc in pending.items() if pending_proc is proc]:
+                    receive_ready(reader)
+                if obj in loaded:
+                    loaded.discard(obj)
+                    print(f"Worker {proc.pid} exited with code {proc.exitcode}, restarting.", file=sys.stderr)
+                    start_worker(slot)
+                    continue
+                load_failures[slot] += 1
+                if not is_ready or load_failures[slot] >= MAX_LOAD_FAILURES:
+                    print(f"Worker {proc.pid} failed to load with code {proc.exitcode}, stopping the server.", file=sys.stderr, flush=True)
+                    stop_workers()
+                    sys.exit(1)
+                delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF_BASE * 2 ** (load_failures[slot] - 1))
+                print(f"Worker {proc.pid} failed to load with code {proc.exitcode}, restarting in {delay}s.", file=sys.stderr)
+                restarts[slot] = time.monotonic() + delay
+        now = time.monotonic()
+        for slot, restart_at in list(restarts.items()):
+            if restart_at <= now:
+                restarts.pop(slot)
+                start_worker(slot)
 
 
 if __name__ == "__main__":
     cores = multiprocessing.cpu_count()
-    threads = max(4, cores)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", "1")))
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
 
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "5631"))
 
-    serve(
-        app,
-        host=host,
-        port=port,
-        threads=threads,
-        expose_tracebacks=True,
-        channel_timeout=60,
-        cleanup_interval=10,
-    )
+    if args.workers > 1:
+        threads = args.threads or max(4, cores // args.workers)
+        serve_prefork(host, port, args.workers, threads)
+    else:
+        threads = args.threads or max(4, cores)
+        exit_on_sigterm()
+        start_loading()
+        try:
+            serve(
+                app,
+                host=host,
+                port=port,
+                threads=threads,
+                expose_tracebacks=True,
+                channel_timeout=60,
+                cleanup_interval=10,
+            )
+        finally:
+            save_caches()
@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+
+import msgpack
+
+
+# Binary snapshot of the server caches, written on shutdown and loaded at
+# startup so that a restart does not begin with cold caches. A snapshot taken
+# on another index version is dropped as a whole.
+SNAPSHOT_VERSION = 1
+
+
+def save_snapshot(path: str, index_version: str, caches: dict):
+    start = time.time()
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "index_version": index_version,
+        "saved_at": time.time(),
+        "caches": {name: cache.items() for name, cache in caches.items()},
+    }
+    with open(f"{path}.tmp", "wb") as fout:
+        msgpack.pack(snapshot, fout)
+    os.replace(f"{path}.tmp", path)
+    sizes = ", ".join(f"{name}: {len(items)}" for name, items in snapshot["caches"].items())
+    print(f"Saved cache snapshot {path} ({sizes}) in {time.time() - start:.1f}s.", file=sys.stderr, flush=True)
+
+
+def load_snapshot(path: str, index_version: str, caches: dict, restore_keys: dict = None):
+    # restore_keys: cache name -> function rebuilding a key, msgpack turns tuples into lists
+    if not os.path.exists(path):
+        return
+    start = time.time()
+    try:
+        with open(path, "rb") as fin:
+            snapshot = msgpack.unpack(fin, strict_map_key=False)
+    except Exception as e:
+        print(f"Cache snapshot {path} is unreadable, ignored: {e}", file=sys.stderr)
+        return
+    if snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("index_version") != index_version:
+        print(f"Cache snapshot {path} is stale, ignored.", file=sys.stderr)
+        return
+
+    # time to live keeps running while the server is down
+    elapsed = max(0.0, time.time() - snapshot["saved_at"])
+    restore_keys = restore_keys or dict()
+    sizes = []
+    for name, cache in caches.items():
+        restore_key = restore_keys.get(name, lambda key: key)
+        items = []
+        for key, value, ttl in snapshot["caches"].get(name, []):
+            if ttl and ttl <= elapsed:
+                continue
+            items.append((restore_key(key), value, ttl - elapsed if ttl else 0))
+        cache.load(items)
+        sizes.append(f"{name}: {len(items)}")
+    print(f"Loaded cache snapshot {path} ({', '.join(sizes)}) in {time.time() - start:.1f}s.", file=sys.stderr)
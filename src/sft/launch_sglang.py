@@ -14,7 +14,7 @@ model_path = sys.argv[1]
 os.environ["CUDA_VISIBLE_DEVICES"] = sys.argv[2]
 
 tp = len(os.environ["CUDA_VISIBLE_DEVICES"].split(','))
-server_process, port = launch_server_cmd(f"python3 -m sglang.launch_server --model-path {model_path} --host 0.0.0.0 --mem-fraction-static 0.8 --tp {tp}")
+server_process, port = launch_server_cmd(f"python3 -m sglang.launch_server --model-path {model_path} --host 0.0.0.0 --mem-fraction-static 0.8 --tp {tp} --schedule-policy lpm --enable-cache-report")
 
 wait_for_server(f"http://localhost:{port}")
 print(f"Server started on http://localhost:{port}")
\ No newline at end of file
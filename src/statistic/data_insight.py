@@ -5,10 +5,14 @@ from collections import Counter, defaultdict
 
 import tiktoken
 from tqdm import tqdm
-from pyserini.search.lucene import LuceneSearcher
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "search_engine"))
+from search_client import get_searcher
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agent"))
+from util.trace import expand_trace, get_user_prompt
 
-searcher = LuceneSearcher("indexes")
+
+searcher = get_searcher("indexes")
 enc = tiktoken.encoding_for_model("gpt-4o")
 
 
@@ -219,7 +223,7 @@ def rollout_data_insight(rollout_file, test_size):
             view_cnt = 0
             web_search_cnt = 0
 
-            trejectory = json.loads(line.strip())
+            trejectory = expand_trace(json.loads(line.strip()))
             steps.append(len(trejectory))
 
             for step in trejectory:
@@ -230,7 +234,7 @@ def rollout_data_insight(rollout_file, test_size):
                 system_prompt = [x["content"] for x in prompt if x["role"] == "system"][
                     0
                 ]
-                user_prompt = [x["content"] for x in prompt if x["role"] == "user"][0]
+                user_prompt = get_user_prompt(prompt)
 
                 reasoning_content = completion["reasoning_content"]
                 content = completion["content"]